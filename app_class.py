@@ -1,12 +1,69 @@
-import pygame, sys, pickle, random
+import pygame, sys, random
 from settings import *
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+import threading
+import time
+import puzzle_store
+import snapshot
+import telemetry
+from text_cache import render_text
+from board_state import BoardState
+from hints import find_hint, candidate_digits
+from prefetch import PuzzlePrefetcher
+from sampler import PuzzleSampler
 
 # Set current directory to script directory for resource loading
 script_dir = os.path.dirname(os.path.abspath(__file__))
 os.chdir(script_dir)
 
+# Posted once a second while the game clock runs (see App.run_idle)
+TICK_EVENT = pygame.USEREVENT + 1
+# Posted by the prefetcher thread when a generated puzzle is ready
+PUZZLE_READY = pygame.USEREVENT + 2
+# Posted by the loader thread once sounds and the puzzle store are loaded
+ASSETS_READY = pygame.USEREVENT + 3
+
+# sudoku.log rolls over to sudoku.log.1 .. .3 at this size
+LOG_FILE = "sudoku.log"
+LOG_MAX_BYTES = 1_000_000
+LOG_BACKUPS = 3
+
+# The one background log writer per process (see App.setup_logger)
+_log_listener = None
+
+SOUNDS = {
+    "reward": "Sounds/reward.wav",
+    "click": "Sounds/click_1.wav",
+    "claps": "Sounds/claps.wav",
+}
+
+DIFFICULTIES = ["Easy", "Medium", "Hard", "Expert"]
+
+# Board sizes the menu cycles through, by box size: 9x9, 16x16, 25x25.
+# Only 9x9 puzzles come from the store; the others are generated in the
+# background on first use.
+BOARD_BOXES = [3, 4, 5]
+
+
+def board_symbols(size):
+    # Symbol typed and shown for values 1..size: digits on 9x9, then
+    # 0-9 and letters, as 16x16 (hex) and 25x25 boards are usually written
+    if size <= 9:
+        return "123456789"[:size]
+    return "0123456789ABCDEFGHIJKLMNO"[:size]
+
+
+def ticks():
+    # Milliseconds on a monotonic clock, for the game timer.
+    # pygame.time.get_ticks() only counts after pygame.init(), which the
+    # App skips (see App.__init__).
+    return int(time.monotonic() * 1000)
+
+
 class SoundManager:
     def __init__(self):
         self.initialized = False
@@ -60,8 +117,7 @@ class Button:
         pygame.draw.rect(window, draw_color, self.rect)
 
         if self.text:
-            font = pygame.font.SysFont("arial", 24)
-            text_surf = font.render(self.text, True, (0,0,0))
+            text_surf = render_text(self.text, 24, (0,0,0))
             text_rect = text_surf.get_rect(center=self.rect.center)
             window.blit(text_surf, text_rect)
 
@@ -76,22 +132,38 @@ class Button:
                 self.function()
 
 class App:
+    # Where the sampler keeps its place between sessions (None: memory only)
+    sampler_file = "sudoku_sampler.json"
+    # Autosaved game in progress, resumed on launch (None: no autosave)
+    snapshot_file = "sudoku_save.bin"
+
     def __init__(self):
+        # Startup is staged: only the display and the menu are set up here,
+        # then a loader thread opens the audio device, decodes the sounds
+        # and loads the puzzle store (see load_assets). Phase times go to
+        # the log once loading is done.
         global window
+        self.startup = telemetry.StageTimer()
+        self.started = time.perf_counter()
         self.logger = self.setup_logger()
 
-        # PyGame
+        # PyGame. Not pygame.init(): that also opens the audio device,
+        # which can take a good part of a second.
         self.sound = SoundManager()
-        pygame.init()
-        self.window = pygame.display.set_mode((WIDTH, HEIGHT))
-        pygame.display.set_caption("Sudoku Game")
+        with self.startup.stage("display"):
+            pygame.display.init()
+            pygame.font.init()
+            self.window = pygame.display.set_mode((WIDTH, HEIGHT))
+            pygame.display.set_caption("Sudoku Game")
         window = self.window
 
         self.difficulty = None
+        self.menu_box = 3  # board size picked on the menu
+        self.size = None  # set with the grid layout by set_board
+        self.lines_layer = None
         self.running = True
         self.paused = False
-        self.grid = testBoard1
-        self.original_grid = [row[:] for row in testBoard1]  # store original for reset
+        self.set_board(testBoard1)
         self.selected = None
         self.mousePos = None
         self.state = "menu"
@@ -99,29 +171,79 @@ class App:
         self.cellChanged = False
         self.playingButtons = []
         self.menuButtons = []
-        self.font = pygame.font.SysFont('arial', cellSize//2)
         self.endButtons = []
-        self.lockedCells = []
-        self.incorrectCells = []
         self.hints_used = 0
         self.hints_max = 3
+        self.waiting = False  # a new game is waiting for the prefetcher
+        self.show_candidates = False  # pencil marks, toggled with P
 
         self.pause_start = None
         self.timer_start = None
         self.elapsed_time = 0
         self.paused_elapsed = 0
 
-        self.load()
-        self.load_puzzles()
-        self.load_menu_buttons()
+        # Dirty-region rendering
+        self.static_layer = None
+        self.static_locked = None
+        self.last_frame = None
+        self.last_menu_frame = None
+        self.info_rects = []
+
+        # Optional session.Recorder, fed every batch of events by run_idle
+        self.recorder = None
+
+        # Filled in by load_puzzles on the loader thread
+        self.store = None
+        self.prefetchers = {}
+        self.bad_records = {}
+        self.sampler = None
+        self.loaded = threading.Event()
+
+        with self.startup.stage("menu"):
+            self.load()
+            self.load_menu_buttons()
+        with self.startup.stage("resume"):
+            self.resume_game()
+        with self.startup.stage("draw"):
+            if self.state == "playing":
+                self.playing_draw()
+            else:
+                self.menu_draw()
+        self.startup_ms = {"first frame": (time.perf_counter() - self.started) * 1000}
+
+        threading.Thread(target=self.load_assets, name="loader", daemon=True).start()
 
-        self.sound.init()
-        self.sound.load("reward", "Sounds/reward.wav")
-        self.sound.load("click", "Sounds/click_1.wav")
-        self.sound.load("claps", "Sounds/claps.wav")
+    def load_assets(self):
+        # Loader thread. Sounds play from whenever they are loaded; a game
+        # picked before the store is ready waits for ASSETS_READY.
+        try:
+            with self.startup.stage("audio"):
+                self.sound.init()
+            with self.startup.stage("sounds"):
+                for name, path in SOUNDS.items():
+                    self.sound.load(name, path)
+        except pygame.error as e:
+            self.logger.warning(f"Sound disabled: {e}")
+        with self.startup.stage("puzzles"):
+            self.load_puzzles()
+
+        self.startup_ms["ready"] = (time.perf_counter() - self.started) * 1000
+        self.loaded.set()
+        pygame.event.post(pygame.event.Event(ASSETS_READY))
+
+        phases = ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.startup.take().items())
+        marks = ", ".join(f"{name} at {ms:.1f} ms" for name, ms in self.startup_ms.items())
+        self.logger.info(f"Startup: {phases} ({marks})")
 
     def setup_logger(self):
+        # The logger only puts records on a queue; a QueueListener thread
+        # formats them and does the console and file writes, so a slow
+        # disk can never hold up a frame. Set up once per process: later
+        # Apps reuse the same pipeline instead of stacking handlers.
+        global _log_listener
         logger = logging.getLogger("Sudoku")
+        if _log_listener is not None:
+            return logger
         logger.setLevel(logging.DEBUG)
         
         # Stream Handler
@@ -129,34 +251,89 @@ class App:
         ch.setLevel(logging.INFO)
         formatter = logging.Formatter('%(levelname)s: %(message)s')
         ch.setFormatter(formatter)
-        logger.addHandler(ch)
 
-        # File Handler
-        fh = logging.FileHandler("sudoku.log")
+        # File Handler, rotated by size
+        fh = logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
         fh.setLevel(logging.DEBUG)
         fh_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
         fh.setFormatter(fh_formatter)
-        logger.addHandler(fh)
+
+        records = queue.SimpleQueue()
+        logger.addHandler(logging.handlers.QueueHandler(records))
+        _log_listener = logging.handlers.QueueListener(records, ch, fh, respect_handler_level=True)
+        _log_listener.start()
+        # Writes out whatever is still queued when the game exits
+        atexit.register(_log_listener.stop)
 
         return logger
 
     # -----------------------------
     # Main loop
     # -----------------------------
-    def run(self):
-        clock = pygame.time.Clock()
-        while self.running:
-            if self.state == "menu":
-                self.menu_events()
-                self.menu_draw()
-            elif self.state == "playing":
-                self.playing_events()
-                self.playing_update()
-                self.playing_draw()
-            clock.tick(60)
+    def run(self, idle=True):
+        if idle:
+            self.run_idle()
+        else:
+            clock = pygame.time.Clock()
+            while self.running:
+                if self.state == "menu":
+                    self.menu_events()
+                    self.menu_draw()
+                elif self.state == "playing":
+                    self.playing_events()
+                    self.playing_update()
+                    self.playing_draw()
+                clock.tick(60)
+        for prefetcher in self.prefetchers.values():
+            prefetcher.close()
+        if self.autosaver is not None:
+            self.autosaver.close()
         pygame.quit()
         sys.exit()
 
+    def run_idle(self):
+        # Sleeps in pygame.event.wait until there is input, or a TICK_EVENT
+        # once a second while the game clock runs. Both draw functions skip
+        # work when nothing visible changed, so an idle screen costs
+        # nothing between wake-ups.
+        ticking = False
+        while self.running:
+            events = [pygame.event.wait()] + pygame.event.get()
+            if self.recorder is not None:
+                self.recorder.write(events)
+            self.frame(events)
+
+            clock_running = self.state == "playing" and not self.paused
+            if clock_running != ticking:
+                pygame.time.set_timer(TICK_EVENT, 1000 if clock_running else 0)
+                ticking = clock_running
+
+    def frame(self, events):
+        # One pass of events, update and draw. Returns the seconds spent in
+        # each phase (update is 0 in the menu).
+        start = time.perf_counter()
+        if self.state == "menu":
+            self.menu_events(events)
+        elif self.state == "playing":
+            self.playing_events(events)
+        handled = time.perf_counter()
+
+        if self.state == "menu":
+            updated = handled
+            self.menu_draw()
+        elif self.state == "playing":
+            self.playing_update()
+            updated = time.perf_counter()
+            self.playing_draw()
+        else:
+            updated = handled
+        drawn = time.perf_counter()
+        return handled - start, updated - handled, drawn - updated
+
+    def pointer(self):
+        # Mouse position for hover effects
+        return pygame.mouse.get_pos()
+
     # -----------------------------
     # Menu functions
     # -----------------------------
@@ -164,74 +341,180 @@ class App:
         start_x = WIDTH//2 - 75
         start_y = HEIGHT//2 - 120
         spacing = 70
-        difficulties = ["Easy", "Medium", "Hard", "Expert"]
-        for i, diff in enumerate(difficulties):
+        for i, diff in enumerate(DIFFICULTIES):
             btn = Button(start_x, start_y + i*spacing, 150, 50, text=diff)
             self.menuButtons.append(btn)
-
-    def menu_events(self):
-        for event in pygame.event.get():
+        size_btn = Button(start_x, start_y + len(DIFFICULTIES)*spacing, 150, 50, color=LOCKEDCELLCOLOR, function=self.cycle_board_size)
+        self.menuButtons.append(size_btn)
+        self.cycle_board_size(step=0)
+
+    def cycle_board_size(self, step=1):
+        # Next board size on the menu's size button
+        self.menu_box = BOARD_BOXES[(BOARD_BOXES.index(self.menu_box) + step) % len(BOARD_BOXES)]
+        size = self.menu_box * self.menu_box
+        self.menuButtons[-1].text = f"{size}x{size}"
+
+    def menu_events(self, events=None):
+        for event in pygame.event.get() if events is None else events:
             if event.type == pygame.QUIT:
                 self.running = False
+            if event.type == pygame.VIDEOEXPOSE:
+                self.invalidate()
+            self.ready_events(event)
             if event.type == pygame.MOUSEBUTTONDOWN:
-                pos = pygame.mouse.get_pos()
+                pos = event.pos
                 for btn in self.menuButtons:
                     if btn.is_clicked(pos):
                         self.sound.play("click", volume=0.6)
-                        difficulty = btn.text.lower()
-                        self.difficulty = difficulty
-                        puzzle, solution = self.get_random_puzzle(difficulty)
-                        self.grid = [row[:] for row in puzzle]
-                        self.original_grid = [row[:] for row in puzzle]  # store original
-                        self.solution = [row[:] for row in solution]
-                        self.lockedCells = [(x,y) for y in range(9) for x in range(9) if puzzle[y][x] != 0]
-                        self.state = "playing"
-                        self.paused = False
-                        self.timer_start = pygame.time.get_ticks()
-                        self.elapsed_time = 0
-                        self.pause_start = None
-                        self.loadButtons()
-                        self.log_solution_board()
+                        if btn.function:
+                            btn.click()
+                            continue
+                        self.difficulty = btn.text.lower()
+                        self.new_game()
+
+    def ready_events(self, event):
+        # Puzzles becoming available, handled the same on the menu and while
+        # playing (a resumed game can press Reset before loading is done)
+        if event.type == PUZZLE_READY and self.waiting and (event.difficulty, event.box) == (self.difficulty, self.menu_box):
+            self.new_game()
+        if event.type == ASSETS_READY:
+            if self.waiting:
+                self.new_game()
+            else:
+                self.invalidate()
+
+    def new_game(self):
+        # Deals a puzzle of self.difficulty and the menu's board size and
+        # starts playing it. If none is ready yet, sets self.waiting and is
+        # called again on PUZZLE_READY.
+        dealt = self.get_random_puzzle(self.difficulty, self.menu_box)
+        self.waiting = dealt is None
+        if self.waiting:
+            self.invalidate()
+            return
+        self.start_game(*dealt)
+        self.log_solution_board()
 
-    def menu_draw(self):
-        self.window.fill(WHITE)
+    def start_game(self, puzzle, solution):
+        self.set_board(puzzle)
+        self.solution = [row[:] for row in solution]
+        self.state = "playing"
+        self.selected = None
+        self.cellChanged = True
+        self.finished = False
 
-        # Get current mouse position
-        mouse_pos = pygame.mouse.get_pos()
+        # Reset timer
+        self.paused = False
+        self.timer_start = ticks()
+        self.elapsed_time = 0
+        self.pause_start = None
+
+        # Fresh buttons (Pause text) and hints
+        self.loadButtons()
+        self.invalidate()
+
+    def resume_game(self):
+        # Picks up where the last session left off, if it saved a game in
+        # progress. The snapshot holds the solution too, so this needs
+        # nothing from the puzzle store and runs before the first frame.
+        self.autosaver = None
+        self.last_snapshot = b""  # nothing handed over yet
+        if self.snapshot_file is None:
+            return
+        self.autosaver = snapshot.Autosaver(self.snapshot_file)
+        saved = snapshot.load(self.snapshot_file)
+        if saved is None:
+            return
+
+        grid, locked = saved["grid"], saved["locked"]
+        givens = [[value if (x, y) in locked else 0 for x, value in enumerate(row)] for y, row in enumerate(grid)]
+        self.difficulty = saved["difficulty"]
+        self.start_game(givens, saved["solution"])
+        for y, row in enumerate(grid):
+            for x, value in enumerate(row):
+                if value and (x, y) not in locked:
+                    self.board.set(x, y, value)
+
+        self.menu_box = self.box
+        self.cycle_board_size(step=0)
+        self.hints_used = saved["hints_used"]
+        self.hints_max = saved["hints_max"]
+        self.elapsed_time = saved["elapsed"]
+        self.timer_start = ticks() - self.elapsed_time * 1000
+        self.logger.info(f"Resumed {self.difficulty} puzzle at {self.elapsed_time // 60:02}:{self.elapsed_time % 60:02}.")
+
+    def autosave(self):
+        # Hands the autosaver a fresh snapshot whenever something in it
+        # changed; it writes on its own thread, at most once a second. A
+        # finished game deletes the snapshot.
+        if self.autosaver is None:
+            return
+        data = None
+        if not self.finished:
+            data = snapshot.pack(
+                self.grid, self.solution, self.lockedCells, self.difficulty,
+                self.hints_used, self.hints_max, self.elapsed_time,
+            )
+        if data != self.last_snapshot:
+            self.last_snapshot = data
+            self.autosaver.update(data)
 
-        # Update and draw buttons
+    def menu_draw(self):
+        # Get current mouse position
+        mouse_pos = self.pointer()
         for btn in self.menuButtons:
             btn.update(mouse_pos)
+
+        # Nothing to do unless a hover state changed
+        frame = [btn.hover for btn in self.menuButtons] + [self.waiting, self.menu_box, self.loaded.is_set()]
+        if frame == self.last_menu_frame:
+            return
+        self.last_menu_frame = frame
+
+        self.window.fill(WHITE)
+
+        # Draw buttons
+        for btn in self.menuButtons:
             btn.draw(self.window)
 
         # Draw title
-        font = pygame.font.SysFont("arial", 48)
-        title_surf = font.render("Pydoku", True, BLACK)
+        title_surf = render_text("Pydoku", 48, BLACK)
         title_rect = title_surf.get_rect(center=(WIDTH//2, HEIGHT//7))
         self.window.blit(title_surf, title_rect)
 
         # Draw your name at bottom
-        font_name = pygame.font.SysFont("arial", 24)
-        name_surf = font_name.render("Hyacinthhax", True, BLACK)
+        name_surf = render_text("Hyacinthhax", 24, BLACK)
         name_rect = name_surf.get_rect(center=(WIDTH//2, HEIGHT-50))
         self.window.blit(name_surf, name_rect)
 
+        if self.waiting:
+            wait_text = f"Generating {self.difficulty} puzzle..." if self.loaded.is_set() else "Loading puzzles..."
+            wait_surf = render_text(wait_text, 24, DARK_GRAY)
+            wait_rect = wait_surf.get_rect(center=(WIDTH//2, HEIGHT-80))
+            self.window.blit(wait_surf, wait_rect)
+
         pygame.display.update()
 
 
     # -----------------------------
     # Playing functions
     # -----------------------------
-    def playing_events(self):
-        for event in pygame.event.get():
+    def playing_events(self, events=None):
+        for event in pygame.event.get() if events is None else events:
             lockedCells = self.lockedCells
 
             if event.type == pygame.QUIT:
                 self.running = False
 
+            if event.type == pygame.VIDEOEXPOSE:
+                self.invalidate()
+
+            self.ready_events(event)
+
             # Mouse clicks
             if event.type == pygame.MOUSEBUTTONDOWN:
-                pos = pygame.mouse.get_pos()
+                pos = event.pos
+                self.mousePos = pos
                 button_clicked = False
                 for button in self.playingButtons:
                     if button.is_clicked(pos):
@@ -243,51 +526,22 @@ class App:
                             if self.difficulty is None:
                                 return  # safety check
 
-                            # Get a new puzzle of the same difficulty
-                            puzzle, solution = self.get_random_puzzle(self.difficulty)
-
-                            self.grid = [row[:] for row in puzzle]
-                            self.original_grid = [row[:] for row in puzzle]
-                            self.solution = [row[:] for row in solution]
-
-                            # Reset locked cells to only original puzzle numbers
-                            self.lockedCells = [(x,y) for y in range(9) for x in range(9) if puzzle[y][x] != 0]
-
-                            # Reset hints and incorrect cells
-                            self.hints_used = 0
-                            self.incorrectCells = []
-                            self.cellChanged = True
-                            self.selected = None
-
-                            # Reset timer
-                            self.elapsed_time = 0
-                            self.timer_start = pygame.time.get_ticks()
-                            self.paused = False
-
-                            # Reset pause button text
-                            for b in self.playingButtons:
-                                if b.text in ["Pause", "Resume"]:
-                                    b.text = "Pause"
-
-                            # Reset finished flag so completion can trigger
-                            self.finished = False
-
-                            # Optional: log solution for debugging
-                            self.log_solution_board()
-
+                            # Get a new puzzle of the same difficulty; the
+                            # current one stays up until it is ready
+                            self.new_game()
 
                         # PAUSE / RESUME
                         elif button.text in ["Pause", "Resume"]:
                             if not self.paused:
                                 self.paused = True
-                                self.pause_start = pygame.time.get_ticks()
+                                self.pause_start = ticks()
 
                                 self.paused_elapsed = self.elapsed_time  # store time at pause (not used but safe to keep)
                                 button.text = "Resume"
                             else:
                                 self.paused = False
                                 # Adjust timer_start by the length of the pause
-                                self.timer_start += pygame.time.get_ticks() - self.pause_start
+                                self.timer_start += ticks() - self.pause_start
                                 self.pause_start = None
                                 button.text = "Pause"
 
@@ -298,11 +552,11 @@ class App:
                         elif button.text == "Menu":
                             # Return to menu safely
                             self.state = "menu"
+                            self.waiting = False
                             self.paused = False
                             self.selected = None
-                            self.incorrectCells = []
-                            self.lockedCells = []
                             self.playingButtons = [] # Clear playing buttons
+                            self.invalidate()
 
                 # Cell selection (only if not paused)
                 if not button_clicked and not self.paused:
@@ -315,62 +569,123 @@ class App:
 
             # Keyboard input (only if not paused)
             if event.type == pygame.KEYDOWN and not self.paused:
-                if self.selected and self.selected not in lockedCells and self.isInt(event.unicode):
-                    self.grid[self.selected[1]][self.selected[0]] = int(event.unicode)
+                value = self.symbolValue(event.unicode)
+                if self.selected and self.selected not in lockedCells and value:
+                    self.board.set(self.selected[0], self.selected[1], value)
                     self.cellChanged = True
+                elif event.unicode.lower() == "p":
+                    self.show_candidates = not self.show_candidates
                 # Added support for number key release if needed, but not in original code
 
     def playing_update(self):
-        self.mousePos = pygame.mouse.get_pos()
+        self.mousePos = self.pointer()
         for button in self.playingButtons:
             button.update(self.mousePos)
 
         if self.timer_start and not self.paused:
             # Calculate elapsed time in seconds
-            self.elapsed_time = (pygame.time.get_ticks() - self.timer_start) // 1000
+            self.elapsed_time = (ticks() - self.timer_start) // 1000
 
+        # Conflicts are kept up to date by self.board on every move, so
+        # completion is just a counter check
         if self.cellChanged:
-            # For simplicity (and speed), only check for errors when the user enters a number
-            self.incorrectCells = []
-            
-            # Simple check against solution (assumes self.solution exists)
-            if self.selected:
-                x, y = self.selected
-                current_val = self.grid[y][x]
-                if current_val != 0 and current_val != self.solution[y][x]:
-                    self.incorrectCells.append((x, y))
-
-            if self.cellChanged:
-                self.incorrectCells = []
-                if self.allCellsDone():
-                    self.checkAllCells()
-                    if len(self.incorrectCells) == 0 and not self.finished:
-                        self.finished = True
-                        self.sound.play("reward", volume=0.9)
-                        self.sound.play("claps", volume=0.9)
-                        self.logger.info(f"Congratulations! \nYou completed {self.difficulty} puzzle in {self.elapsed_time} seconds!\nWith only {self.hints_used}/{self.hints_max}")
-                        self.paused = True
+            if self.board.is_solved() and not self.finished:
+                self.finished = True
+                self.sound.play("reward", volume=0.9)
+                self.sound.play("claps", volume=0.9)
+                self.logger.info(f"Congratulations! \nYou completed {self.difficulty} puzzle in {self.elapsed_time} seconds!\nWith only {self.hints_used}/{self.hints_max}")
+                self.paused = True
+
+        self.autosave()
 
     def playing_draw(self):
-        self.window.fill(WHITE)
-        self.draw_difficulty(self.window) # Draw difficulty above grid/buttons
-        for button in self.playingButtons:
-            button.draw(self.window)
-        
-        # Draw selections/shades BEFORE numbers to avoid drawing over them
-        if self.selected:
-            self.drawSelection(self.window, self.selected)
-        
-        self.shadeLockedCells(self.window, self.lockedCells)
-        self.shadeIncorrectCells(self.window, self.incorrectCells)
-        
-        self.drawNumbers(self.window)
-        self.drawGrid(self.window)
-        self.draw_timer(self.window)
-        
-        pygame.display.update()
+        # Only repaints what changed since the last frame and only pushes
+        # those rects to the display. Anything that just follows the locked
+        # cells lives on the cached static layer.
+        locked = self.lockedCells
+        if self.static_layer is None or locked != self.static_locked:
+            self.build_static_layers()
+
+        incorrect = self.board.conflicts
+        candidates = self.board.candidates if self.show_candidates else (lambda x, y: 0)
+        frame = {
+            "cells": [
+                (self.grid[y][x], (x, y) in locked, self.selected == (x, y), (x, y) in incorrect, candidates(x, y))
+                for y in range(self.size) for x in range(self.size)
+            ],
+            "buttons": [(button.text, button.hover) for button in self.playingButtons],
+            "info": (self.elapsed_time, self.hints_used, self.hints_max),
+        }
+        last = self.last_frame
+        if last is None:
+            self.window.blit(self.static_layer, (0, 0))
+        dirty = []
+
+        for i, cell in enumerate(frame["cells"]):
+            if last is None or cell != last["cells"][i]:
+                dirty.append(self.draw_cell(self.window, i % self.size, i // self.size))
+
+        for i, button in enumerate(self.playingButtons):
+            if last is None or frame["buttons"][i] != last["buttons"][i]:
+                button.draw(self.window)
+                dirty.append(button.rect)
+
+        if last is None or frame["info"] != last["info"]:
+            for rect in self.info_rects:
+                self.window.blit(self.static_layer, rect, rect)
+            dirty.extend(self.info_rects)
+            self.info_rects = self.draw_timer(self.window)
+            dirty.extend(self.info_rects)
+
+        if last is None:
+            pygame.display.update()
+        elif dirty:
+            pygame.display.update(dirty)
+        self.last_frame = frame
         self.cellChanged = False
 
+    # -----------------------------
+    # Dirty-region helpers
+    # -----------------------------
+    def invalidate(self):
+        # Next draw repaints the whole window
+        self.last_frame = None
+        self.last_menu_frame = None
+
+    def build_static_layers(self):
+        self.static_layer = pygame.Surface((WIDTH, HEIGHT))
+        self.static_layer.fill(WHITE)
+        self.draw_difficulty(self.static_layer)
+        self.shadeLockedCells(self.static_layer, self.lockedCells)
+        self.static_locked = set(self.lockedCells)
+
+        # Grid lines go on their own transparent layer so they can be
+        # laid back over a single repainted cell
+        if self.lines_layer is None:
+            self.lines_layer = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+            self.drawGrid(self.lines_layer)
+
+    def draw_cell(self, window, x, y):
+        # Repaints one cell from the static layer up; returns the rect
+        # touched, borders included
+        rect = pygame.Rect(x*self.cellSize+self.gridPos[0], y*self.cellSize+self.gridPos[1], self.cellSize, self.cellSize)
+        window.blit(self.static_layer, rect, rect)
+        if self.selected == (x, y):
+            self.drawSelection(window, (x, y))
+        if (x, y) in self.board.conflicts:
+            self.shadeIncorrectCells(window, [(x, y)])
+
+        num = self.grid[y][x]
+        if num != 0:
+            color = DARK_GRAY if (x, y) in self.lockedCells else BLACK
+            self.textToScreen(window, self.symbols[num - 1], rect.topleft, color)
+        elif self.show_candidates:
+            self.drawCandidates(window, rect, self.board.candidates(x, y))
+
+        border = rect.inflate(4, 4)
+        window.blit(self.lines_layer, border, border)
+        return border
+
     # -----------------------------
     # Timer/Info draw
     # -----------------------------
@@ -379,22 +694,21 @@ class App:
         seconds = self.elapsed_time % 60
         time_str = f"{minutes:02}:{seconds:02}"
 
-        font = pygame.font.SysFont("arial", 30)
-        text_surf = font.render(time_str, True, BLACK)
+        text_surf = render_text(time_str, 30, BLACK)
 
         # --- TIMER: centered below grid ---
         timer_rect = text_surf.get_rect(
             midtop=(
-                gridPos[0] + gridSize // 2,
-                gridPos[1] + gridSize + 10
+                self.gridPos[0] + self.gridSize // 2,
+                self.gridPos[1] + self.gridSize + 10
             )
         )
         window.blit(text_surf, timer_rect)
+        rects = [timer_rect]
 
         # --- HINT COUNTER ABOVE HINT BUTTON (unchanged) ---
-        hint_font = pygame.font.SysFont("arial", 22)
         hint_str = f"Hints: {self.hints_used}/{self.hints_max}"
-        hint_surf = hint_font.render(hint_str, True, BLACK)
+        hint_surf = render_text(hint_str, 22, BLACK)
 
         for button in self.playingButtons:
             if button.text == "Hint":
@@ -402,113 +716,80 @@ class App:
                     midbottom=(button.rect.centerx, button.rect.top - 5)
                 )
                 window.blit(hint_surf, hint_rect)
+                rects.append(hint_rect)
                 break
 
+        return rects
+
     def draw_difficulty(self, window):
         if not self.difficulty:
             return
 
-        font = pygame.font.SysFont("arial", 28)
         text = f"Difficulty: {self.difficulty.capitalize()}"
-        surf = font.render(text, True, BLACK)
+        if self.box != 3:
+            text += f" ({self.size}x{self.size})"
+        surf = render_text(text, 28, BLACK)
 
         # Position above the buttons/grid
-        x = gridPos[0]
-        y = gridPos[1] - 100
+        x = self.gridPos[0]
+        y = self.gridPos[1] - 100
 
         window.blit(surf, (x, y))
 
-    def allCellsDone(self):
-        for row in self.grid:
-            for number in row:
-                if number == 0:
-                    return False
-        return True
-
-    def checkAllCells(self):
-        self.checkRows()
-        self.checkColumns()
-        self.checkSmallGrid()
-
-    def checkSmallGrid(self):
-        for x in range(3):
-            for y in range(3):
-                # This logic is likely flawed for *checking correctness*. It seems designed for a solver.
-                possibles = list(range(1,10))
-                for i in range(3):
-                    for j in range(3):
-                        xidx = x*3+i
-                        yidx = y*3+j
-                        if self.grid[yidx][xidx] != 0 and self.grid[yidx][xidx] in possibles:
-                            possibles.remove(self.grid[yidx][xidx])
-                        elif self.grid[yidx][xidx] != 0 and (xidx, yidx) not in self.lockedCells and (xidx, yidx) not in self.incorrectCells:
-                            # A duplicate was found in this subgrid's 'possibles' logic
-                            pass # simplified to avoid complex error handling that might conflict
-
-    def checkRows(self):
-        for yidx, row in enumerate(self.grid):
-            possibles = list(range(1,10))
-            for xidx in range(9):
-                if self.grid[yidx][xidx] != 0 and self.grid[yidx][xidx] in possibles:
-                    possibles.remove(self.grid[yidx][xidx])
-                elif self.grid[yidx][xidx] != 0 and (xidx, yidx) not in self.lockedCells and (xidx, yidx) not in self.incorrectCells:
-                    pass # simplified
-
-    def checkColumns(self):
-        for xidx in range(9):
-            possibles = list(range(1,10))
-            for yidx in range(9):
-                if self.grid[yidx][xidx] != 0 and self.grid[yidx][xidx] in possibles:
-                    possibles.remove(self.grid[yidx][xidx])
-                elif self.grid[yidx][xidx] != 0 and (xidx, yidx) not in self.lockedCells and (xidx, yidx) not in self.incorrectCells:
-                    pass # simplified
+    def set_board(self, puzzle):
+        # Fresh grid plus its incremental conflict/completion tracker;
+        # the puzzle's own numbers are locked. The grid layout follows the
+        # board size: 9x9 keeps the settings values, bigger boards shrink
+        # the cells to fit the same area.
+        size = len(puzzle)
+        if size != self.size:
+            self.size = size
+            self.box = round(size ** 0.5)
+            self.symbols = board_symbols(size)
+            self.cellSize = cellSize if size == 9 else gridSize // size
+            self.gridSize = self.cellSize * size
+            self.gridPos = (gridPos[0] + (gridSize - self.gridSize) // 2, gridPos[1])
+            self.static_layer = None
+            self.lines_layer = None
+        self.grid = [row[:] for row in puzzle]
+        self.original_grid = [row[:] for row in puzzle]  # store original for reset
+        self.board = BoardState(self.grid)
+        self.lockedCells = {(x, y) for y in range(size) for x in range(size) if puzzle[y][x] != 0}
 
     # -----------------------------
     # Helper functions
     # -----------------------------
     def shadeLockedCells(self, window, locked):
         for cell in locked:
-            pygame.draw.rect(window, LOCKEDCELLCOLOR, (cell[0]*cellSize+gridPos[0], cell[1]*cellSize+gridPos[1], cellSize, cellSize))
+            pygame.draw.rect(window, LOCKEDCELLCOLOR, (cell[0]*self.cellSize+self.gridPos[0], cell[1]*self.cellSize+self.gridPos[1], self.cellSize, self.cellSize))
 
     def shadeIncorrectCells(self, window, incorrect):
         for cell in incorrect:
-            pygame.draw.rect(window, INCORRECTCELLCOLOR, (cell[0]*cellSize+gridPos[0], cell[1]*cellSize+gridPos[1], cellSize, cellSize))
-
-    def drawNumbers(self, window):
-        for yidx, row in enumerate(self.grid):
-            for xidx, num in enumerate(row):
-                if num != 0:
-                    pos = [xidx*cellSize+gridPos[0], yidx*cellSize+gridPos[1]]
-                    # Use a different color for user-entered vs. locked numbers
-                    color = BLACK
-                    if (xidx, yidx) in self.lockedCells:
-                         color = DARK_GRAY # or a distinct color
-                    
-                    self.textToScreen(window, str(num), pos, color)
+            pygame.draw.rect(window, INCORRECTCELLCOLOR, (cell[0]*self.cellSize+self.gridPos[0], cell[1]*self.cellSize+self.gridPos[1], self.cellSize, self.cellSize))
 
     def drawSelection(self, window, pos):
-        pygame.draw.rect(window, LIGHTBLUE, (pos[0]*cellSize+gridPos[0], pos[1]*cellSize+gridPos[1], cellSize, cellSize))
+        pygame.draw.rect(window, LIGHTBLUE, (pos[0]*self.cellSize+self.gridPos[0], pos[1]*self.cellSize+self.gridPos[1], self.cellSize, self.cellSize))
 
     def drawGrid(self, window):
         # Outer Border
-        pygame.draw.rect(window, BLACK, (gridPos[0], gridPos[1], gridSize, gridSize), 2)
+        pygame.draw.rect(window, BLACK, (self.gridPos[0], self.gridPos[1], self.gridSize, self.gridSize), 2)
         
         # Inner lines
-        for x in range(1, 9):
+        for x in range(1, self.size):
             # Vertical lines
-            thickness = 2 if x % 3 == 0 else 1
-            pygame.draw.line(window, BLACK, (gridPos[0]+x*cellSize, gridPos[1]), (gridPos[0]+x*cellSize, gridPos[1]+gridSize), thickness)
+            thickness = 2 if x % self.box == 0 else 1
+            pygame.draw.line(window, BLACK, (self.gridPos[0]+x*self.cellSize, self.gridPos[1]), (self.gridPos[0]+x*self.cellSize, self.gridPos[1]+self.gridSize), thickness)
             # Horizontal lines
-            pygame.draw.line(window, BLACK, (gridPos[0], gridPos[1]+x*cellSize), (gridPos[0]+gridSize, gridPos[1]+x*cellSize), thickness)
+            pygame.draw.line(window, BLACK, (self.gridPos[0], self.gridPos[1]+x*self.cellSize), (self.gridPos[0]+self.gridSize, self.gridPos[1]+x*self.cellSize), thickness)
 
 
     def mouseOnGrid(self):
         # Check if mouse is within the grid boundaries
-        if self.mousePos[0] < gridPos[0] or self.mousePos[1] < gridPos[1]: return False
-        if self.mousePos[0] > gridPos[0]+gridSize or self.mousePos[1] > gridPos[1]+gridSize: return False
+        if self.mousePos[0] < self.gridPos[0] or self.mousePos[1] < self.gridPos[1]: return False
+        if self.mousePos[0] > self.gridPos[0]+self.gridSize or self.mousePos[1] > self.gridPos[1]+self.gridSize: return False
         
         # Calculate cell coordinates
-        cell = ((self.mousePos[0]-gridPos[0])//cellSize, (self.mousePos[1]-gridPos[1])//cellSize)
+        cell = ((self.mousePos[0]-self.gridPos[0])//self.cellSize, (self.mousePos[1]-self.gridPos[1])//self.cellSize)
         return cell # Return (x, y) tuple
 
     def loadButtons(self):
@@ -524,8 +805,8 @@ class App:
         total_width = num_buttons * btn_width + (num_buttons - 1) * spacing
 
         # Start x to center over grid
-        start_x = gridPos[0] + (gridSize - total_width) // 2
-        start_y = gridPos[1] - 60  # above grid
+        start_x = self.gridPos[0] + (self.gridSize - total_width) // 2
+        start_y = self.gridPos[1] - 60  # above grid
 
         # Create buttons
         reset_btn = Button(start_x, start_y, btn_width, btn_height, text="Reset")
@@ -540,90 +821,151 @@ class App:
         self.hints_max = 3
 
     def use_hint(self):
-        empty_cells = [(x, y) for y in range(9) for x in range(9) if self.grid[y][x] == 0]
-        if not empty_cells:
-            return
-        
-        x, y = random.choice(empty_cells)
-        self.grid[y][x] = self.solution[y][x]
+        # Prefer the next cell that follows logically from the board. If
+        # none does, or the player's mistakes led it astray, reveal a
+        # random cell from the solution as before.
+        hint = find_hint(self.board)
+        if hint is not None and hint[2] == self.solution[hint[1]][hint[0]]:
+            x, y, _, technique = hint
+        else:
+            empty_cells = [(x, y) for y in range(self.size) for x in range(self.size) if self.grid[y][x] == 0]
+            if not empty_cells:
+                return
+            x, y = random.choice(empty_cells)
+            technique = "solution"
+
+        self.board.set(x, y, self.solution[y][x])
         
         # Lock the cell if it's a hint
-        if (x, y) not in self.lockedCells:
-            self.lockedCells.append((x, y)) 
+        self.lockedCells.add((x, y))
             
         self.hints_used += 1
         self.cellChanged = True
         
-        self.logger.debug(f"Hint used. Cell ({x+1}, {y+1}) filled with {self.solution[y][x]}. Hints remaining: {self.hints_max - self.hints_used}")
+        self.logger.debug(f"Hint used ({technique}). Cell ({x+1}, {y+1}) filled with {self.solution[y][x]}. Hints remaining: {self.hints_max - self.hints_used}")
+
+    def drawCandidates(self, window, rect, mask):
+        # Pencil marks: digit d in slot d of a box x box layout inside the
+        # cell (3x3 on a normal board)
+        box = self.box
+        third = self.cellSize // box
+        for digit in candidate_digits(mask):
+            surf = render_text(self.symbols[digit - 1], max(self.cellSize // (box + 1), 4), DARK_GRAY, antialias=False)
+            slot_x = rect.left + ((digit - 1) % box) * third + (third - surf.get_width()) // 2
+            slot_y = rect.top + ((digit - 1) // box) * third + (third - surf.get_height()) // 2
+            window.blit(surf, (slot_x, slot_y))
 
     def textToScreen(self, window, text, pos, color=BLACK):
-        font_surf = self.font.render(text, False, color)
+        font_surf = render_text(text, self.cellSize//2, color, antialias=False)
         fontWidth, fontHeight = font_surf.get_width(), font_surf.get_height()
         
         # Center text in the cell
-        x = pos[0] + (cellSize-fontWidth)//2
-        y = pos[1] + (cellSize-fontHeight)//2
+        x = pos[0] + (self.cellSize-fontWidth)//2
+        y = pos[1] + (self.cellSize-fontHeight)//2
         window.blit(font_surf, (x, y))
 
     def load(self):
-        global lockedCells
-        self.lockedCells = []
-        for yidx, row in enumerate(self.grid):
-            for xidx, num in enumerate(row):
-                if num != 0:
-                    self.lockedCells.append((xidx, yidx))
-        lockedCells = self.lockedCells
-
         # Load buttons after initial setup
         self.loadButtons() 
 
-    def isInt(self, string):
-        try:
-            val = int(string)
-            return 1 <= val <= 9
-        except:
-            return False
+    def symbolValue(self, string):
+        # Value typed for a key on this board size, or 0 for anything else
+        index = self.symbols.find(string.upper()) if len(string) == 1 else -1
+        return index + 1
 
     def log_solution_board(self):
         if not hasattr(self, "solution") or self.solution is None:
             self.logger.debug("No solution loaded yet.")
             return
 
-        self.logger.debug("\n--- Sudoku Solution ---")
-        for y in range(9):
+        # One record for the whole board rather than one per row
+        box, size = self.box, self.size
+        lines = ["", "--- Sudoku Solution ---"]
+        for y in range(size):
             row_str = ""
-            for x in range(9):
+            for x in range(size):
                 val = self.solution[y][x]
-                row_str += str(val) if val != 0 else "."
-                if x % 3 == 2 and x != 8:
+                row_str += self.symbols[val - 1] if val != 0 else "."
+                if x % box == box - 1 and x != size - 1:
                     row_str += " | "
                 else:
                     row_str += " "
-            self.logger.debug(row_str)
-            if y % 3 == 2 and y != 8:
-                self.logger.debug("-" * 21)
+            lines.append(row_str)
+            if y % box == box - 1 and y != size - 1:
+                lines.append("-" * (2 * size + 2 * (box - 1) - 1))
+        self.logger.debug("\n".join(lines))
 
     # -----------------------------
     # Puzzle loading
     # -----------------------------
-    def load_puzzles(self, filename="sudoku_puzzles.pkl"):
-        # The file loading may fail if the file is missing/corrupted, use try-except
+    def load_puzzles(self, filename="sudoku_puzzles.bin", legacy_filename="sudoku_puzzles.pkl"):
+        # The store is memory-mapped, so opening it only reads the header.
+        # An old pickle file is converted once if no store exists yet.
+        # Difficulties the store can't serve are generated in the
+        # background instead. Runs on the loader thread.
+        self.store = None
+        self.prefetchers = {}  # box size -> PuzzlePrefetcher
+        self.bad_records = {}  # difficulty -> indices found invalid when dealt
+        self.sampler = PuzzleSampler(self.sampler_file)
         try:
-            with open(filename, "rb") as f:
-                self.all_puzzles = pickle.load(f)
+            if not os.path.exists(filename) and os.path.exists(legacy_filename):
+                self.logger.info(f"Converting '{legacy_filename}' to '{filename}'...")
+                puzzle_store.convert_pickle(legacy_filename, filename)
+            self.store = puzzle_store.PuzzleStore(filename)
         except FileNotFoundError:
             self.logger.error(f"Puzzle file '{filename}' not found. Please create it.")
-            self.all_puzzles = {}
         except Exception as e:
             self.logger.error(f"Error loading puzzles: {e}")
-            self.all_puzzles = {}
-
 
-    def get_random_puzzle(self, difficulty="medium"):
-        if difficulty in self.all_puzzles and self.all_puzzles[difficulty]:
-            return random.choice(self.all_puzzles[difficulty])
-        else:
-            self.logger.warning(f"No puzzles found for difficulty '{difficulty}'.")
+        missing = [diff.lower() for diff in DIFFICULTIES if not self.puzzle_count(diff.lower())]
+        if missing:
+            self.logger.info(f"Generating {', '.join(missing)} puzzles in the background.")
+            self.start_prefetcher(3, missing)
+
+    def start_prefetcher(self, box, difficulties):
+        # Background generator for one board size; PUZZLE_READY carries the
+        # difficulty and box of each puzzle it finishes
+        self.prefetchers[box] = PuzzlePrefetcher(
+            difficulties, box=box,
+            on_ready=lambda difficulty: pygame.event.post(pygame.event.Event(PUZZLE_READY, difficulty=difficulty, box=box)),
+        )
+        return self.prefetchers[box]
+
+    def puzzle_count(self, difficulty):
+        # Puzzles in the store for a difficulty, less any found invalid
+        if self.store is None:
+            return 0
+        return self.store.count(difficulty) - len(self.bad_records.get(difficulty, ()))
+
+    def get_random_puzzle(self, difficulty="medium", box=3):
+        # (puzzle, solution), or None while the store is still loading or a
+        # generated one isn't ready
+        if not self.loaded.is_set():
+            self.logger.info("Puzzles are still loading.")
+            return None
+        while box == 3 and self.puzzle_count(difficulty):
+            # No repeats until every puzzle of the difficulty has been dealt.
+            # Each record is checked as it is dealt rather than the whole
+            # store at launch; a bad one is remembered and another drawn.
+            index = self.sampler.draw(difficulty, self.store.count(difficulty))
+            bad = self.bad_records.setdefault(difficulty, set())
+            if index in bad:
+                continue
+            puzzle, solution = self.store.get(difficulty, index)
+            if puzzle_store.validate_grids(puzzle, solution)[0]:
+                return puzzle.tolist(), solution.tolist()
+            self.logger.error(f"Skipping invalid {difficulty} puzzle {index} in the store.")
+            bad.add(index)
+        prefetcher = self.prefetchers.get(box)
+        if prefetcher is None:
+            # Bigger boards are never stored (nor is a 9x9 difficulty whose
+            # records all turned out bad); their generator starts on first
+            # use and queues difficulties as they are asked for
+            prefetcher = self.start_prefetcher(box, [])
+        dealt = prefetcher.take(difficulty) if prefetcher is not None else None
+        if dealt is None:
+            self.logger.info(f"No {difficulty} puzzle ready yet, generating one.")
+        return dealt
             
 if __name__ == '__main__':
     # Initialize game
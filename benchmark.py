@@ -0,0 +1,243 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+
+import precompute
+
+# -----------------------------
+# Fixed solver corpus
+# -----------------------------
+# Known-hard puzzles (all with exactly one solution) for solver worst
+# cases; these never change between runs so timings stay comparable.
+
+HARD_CORPUS = {
+    "inkala_2012": "8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..",
+    "ai_escargot": "1....7.9..3..2...8..96..5....53..9...1..8...26....4...3......1..4......7..7...3..",
+    "easter_monster": "1.......2.9.4...5...6...7...5.9.3.......7.......85..4.7.....6...3...9.8...2.....1",
+    "anti_backtrack": "..............3.85..1.2.......5.7.....4...1...9.......5......73..2.1........4...9",
+    "sparse_17": ".......1.4.........2...........5.4.7..8...3....1.9....3..4..2...5.1........8.6...",
+    "hard_a": "12.3....435....1....4........54..2..6...7.........8.9...31..5.......9.7.....6...8",
+    "hard_b": ".2.4.37.........32........4.4.2...7.8...5.........1...5.....9...3.9....7..1..86..",
+}
+
+DIFFICULTIES = ["easy", "medium", "hard", "expert"]
+
+
+def parse_puzzle(line):
+    return np.array([0 if ch in ".0" else int(ch) for ch in line]).reshape(9, 9)
+
+
+# -----------------------------
+# Timing helpers
+# -----------------------------
+
+def summarize(latencies):
+    latencies = np.asarray(latencies)
+    total = float(latencies.sum())
+    return {
+        "n": len(latencies),
+        "total_s": total,
+        "puzzles_per_sec": len(latencies) / total if total else float("inf"),
+        "mean_ms": float(latencies.mean() * 1000),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+    }
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def seed_all(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+# -----------------------------
+# Benchmarks
+# -----------------------------
+
+def bench_generate(n, seed):
+    seed_all(seed)
+    return summarize([timed(precompute.generate_full_solution)[1] for _ in range(n)])
+
+
+def bench_dig(n, seed, solvers):
+    # Every backend digs the same solutions with the same RNG state, so the
+    # dug puzzles must come out identical too
+    results = {}
+    mismatches = []
+    for diff in DIFFICULTIES:
+        seed_all(seed)
+        solutions = [precompute.generate_full_solution() for _ in range(n)]
+        dug = {}
+        for name in solvers:
+            latencies = []
+            dug[name] = []
+            for i, solution in enumerate(solutions):
+                random.seed(seed * 1000 + i)
+                puzzle, elapsed = timed(precompute.make_puzzle_from_solution, solution, diff, name)
+                latencies.append(elapsed)
+                dug[name].append(puzzle)
+            results[f"dig/{diff}/{name}"] = summarize(latencies)
+        if "batch" in solvers:
+            # The batch backend digging all n at once (see dig_batch); the
+            # latency is each puzzle's share of the one call
+            orders = []
+            for i in range(n):
+                random.seed(seed * 1000 + i)
+                orders.append(precompute.dig_order())
+            stacked, elapsed = timed(precompute.dig_batch, solutions, orders, precompute.target_clues(diff))
+            results[f"dig/{diff}/batch-stack"] = summarize([elapsed / n] * n)
+            dug["batch-stack"] = list(stacked)
+        first = solvers[0]
+        for name in list(dug)[1:]:
+            for i, (a, b) in enumerate(zip(dug[first], dug[name])):
+                if not np.array_equal(a, b):
+                    mismatches.append(f"dig/{diff}/{i}: {first} != {name}")
+    return results, mismatches
+
+
+def bench_solve(corpora, solvers, repeat):
+    # corpora: dict name -> list of puzzles. Checks the backends agree on
+    # every solution count.
+    results = {}
+    mismatches = []
+    for corpus, puzzles in corpora.items():
+        counts = {}
+        for name in solvers:
+            solve = precompute.get_solver(name)
+            latencies = []
+            counts[name] = []
+            for puzzle in puzzles:
+                for _ in range(repeat):
+                    count, elapsed = timed(solve, puzzle, 2)
+                    latencies.append(elapsed)
+                counts[name].append(count)
+            results[f"solve/{corpus}/{name}"] = summarize(latencies)
+        first = solvers[0]
+        for name in solvers[1:]:
+            for i, (a, b) in enumerate(zip(counts[first], counts[name])):
+                if a != b:
+                    mismatches.append(f"solve/{corpus}/{i}: {first}={a} {name}={b}")
+    return results, mismatches
+
+
+def generated_corpora(n, seed):
+    corpora = {}
+    for diff in DIFFICULTIES:
+        seed_all(seed)
+        corpora[diff] = [precompute.generate_single_puzzle(diff)[0] for _ in range(n)]
+    return corpora
+
+
+def bench_sizes(n, seed, boxes):
+    # How generation scales with board size: full solution, dig and one
+    # solve of the result per box size (3: 9x9, 4: 16x16, 5: 25x25). Dig
+    # entries also record the mean clue share reached, since bigger
+    # boards may stop short of their difficulty's target.
+    results = {}
+    for box in boxes:
+        size = box * box
+        name = f"size/{size}x{size}"
+        seed_all(seed)
+        results[f"{name}/generate"] = summarize([timed(precompute.generate_full_solution, box)[1] for _ in range(n)])
+        for diff in DIFFICULTIES:
+            seed_all(seed)
+            dig, solve, clues = [], [], []
+            for _ in range(n):
+                solution = precompute.generate_full_solution(box)
+                puzzle, elapsed = timed(precompute.make_puzzle_from_solution, solution, diff)
+                dig.append(elapsed)
+                solve.append(timed(precompute.solve_and_count, puzzle, 2)[1])
+                clues.append(np.count_nonzero(puzzle) / puzzle.size)
+            results[f"{name}/dig/{diff}"] = dict(summarize(dig), mean_clue_share=float(np.mean(clues)))
+            results[f"{name}/solve/{diff}"] = summarize(solve)
+    return results
+
+
+def compare(results, baseline_file):
+    with open(baseline_file) as f:
+        baseline = json.load(f)["results"]
+    print(f"\nCompared with {baseline_file} (p50, lower is better):")
+    for name, stats in results.items():
+        if name in baseline:
+            ratio = stats["p50_ms"] / baseline[name]["p50_ms"] if baseline[name]["p50_ms"] else float("inf")
+            print(f"  {name:<32} {baseline[name]['p50_ms']:9.3f} -> {stats['p50_ms']:9.3f} ms  x{ratio:.2f}")
+
+
+def run(args):
+    solvers = args.solvers.split(",")
+    for name in solvers:
+        precompute.get_solver(name)
+
+    results = {}
+    mismatches = []
+
+    results["generate_full_solution"] = bench_generate(args.n, args.seed)
+
+    corpora = generated_corpora(args.n, args.seed)
+    corpora["hard_corpus"] = [parse_puzzle(line) for line in HARD_CORPUS.values()]
+    solved, bad = bench_solve(corpora, solvers, args.repeat)
+    results.update(solved)
+    mismatches += bad
+
+    dug, bad = bench_dig(args.n, args.seed, solvers)
+    results.update(dug)
+    mismatches += bad
+
+    if args.sizes:
+        results.update(bench_sizes(args.size_n, args.seed, [int(box) for box in args.sizes.split(",")]))
+
+    for name, stats in results.items():
+        clues = f"  clues {stats['mean_clue_share']:.0%}" if "mean_clue_share" in stats else ""
+        print(f"{name:<34} {stats['puzzles_per_sec']:10.1f}/s  p50 {stats['p50_ms']:9.3f} ms  p99 {stats['p99_ms']:9.3f} ms{clues}")
+    for line in mismatches:
+        print(f"MISMATCH {line}")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "seed": args.seed,
+        "n": args.n,
+        "repeat": args.repeat,
+        "solvers": solvers,
+        "sizes": args.sizes,
+        "results": results,
+        "mismatches": mismatches,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved results to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    return 1 if mismatches else 0
+
+
+# -----------------------------
+# Entry point
+# -----------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the puzzle generator and solvers.")
+    parser.add_argument("-n", type=int, default=20, help="puzzles per difficulty (default 20)")
+    parser.add_argument("--seed", type=int, default=12345)
+    parser.add_argument("--repeat", type=int, default=3, help="timed solves per puzzle (default 3)")
+    parser.add_argument("--solvers", default=",".join(precompute.SOLVERS),
+                        help="comma-separated backends (default: all)")
+    parser.add_argument("--sizes", default="3,4,5",
+                        help="comma-separated box sizes for the board size benchmark, empty to skip (default 3,4,5)")
+    parser.add_argument("--size-n", type=int, default=5, help="puzzles per difficulty and board size (default 5)")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", help="earlier benchmark JSON to compare against")
+    sys.exit(run(parser.parse_args()))
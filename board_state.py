@@ -0,0 +1,110 @@
+# -----------------------------
+# Incremental board state
+# -----------------------------
+# For every row, column and box, keeps which cells hold each digit, plus a
+# count of empty cells. A move only touches the three units of one cell,
+# so conflict tracking and completion checks cost the same however full
+# the board is.
+#
+# Units are numbered like precompute._UNITS: rows 0-8, columns 9-17,
+# boxes 18-26. Each unit also has a 9-bit mask of the digits it holds
+# (bit d-1 for digit d), so a cell's candidates are three ORs away.
+#
+# 16x16 and 25x25 boards work the same way with layout(4) and layout(5):
+# size rows, then size columns, then size boxes, and size-bit masks.
+
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def layout(box):
+    # (cell -> its three units, unit -> its cells) for box x box boxes
+    size = box * box
+    cell_units = {
+        (x, y): (y, size + x, 2 * size + (y // box) * box + x // box)
+        for y in range(size) for x in range(size)
+    }
+    unit_cells = [[] for _ in range(3 * size)]
+    for cell, units in cell_units.items():
+        for unit in units:
+            unit_cells[unit].append(cell)
+    return cell_units, unit_cells
+
+
+class BoardState:
+    def __init__(self, grid):
+        # grid is edited in place by set(), so callers can keep drawing
+        # from the same list of lists
+        self.grid = grid
+        self.size = len(grid)
+        self.box = round(self.size ** 0.5)
+        self.all_digits = (1 << self.size) - 1
+        self.cell_units, self.unit_cells = layout(self.box)
+        self.units = [[set() for _ in range(self.size + 1)] for _ in range(3 * self.size)]
+        self.masks = [0] * (3 * self.size)
+        self.empty = 0
+        self.conflicts = set()
+
+        for (x, y), units in self.cell_units.items():
+            value = grid[y][x]
+            if value:
+                for unit in units:
+                    self.units[unit][value].add((x, y))
+                    self.masks[unit] |= 1 << (value - 1)
+            else:
+                self.empty += 1
+
+        for unit in self.units:
+            for cells in unit:
+                if len(cells) > 1:
+                    self.conflicts.update(cells)
+
+    def set(self, x, y, value):
+        cell = (x, y)
+        old = self.grid[y][x]
+        if old == value:
+            return
+
+        if old:
+            for unit in self.cell_units[cell]:
+                cells = self.units[unit][old]
+                cells.discard(cell)
+                if not cells:
+                    self.masks[unit] &= ~(1 << (old - 1))
+                # A lone leftover may have stopped clashing
+                elif len(cells) == 1:
+                    self._refresh(next(iter(cells)))
+        else:
+            self.empty -= 1
+
+        self.grid[y][x] = value
+        if value:
+            for unit in self.cell_units[cell]:
+                cells = self.units[unit][value]
+                cells.add(cell)
+                self.masks[unit] |= 1 << (value - 1)
+                if len(cells) > 1:
+                    self.conflicts.update(cells)
+        else:
+            self.empty += 1
+
+        self._refresh(cell)
+
+    def _refresh(self, cell):
+        value = self.grid[cell[1]][cell[0]]
+        if value and any(len(self.units[unit][value]) > 1 for unit in self.cell_units[cell]):
+            self.conflicts.add(cell)
+        else:
+            self.conflicts.discard(cell)
+
+    def candidates(self, x, y):
+        # Mask of the digits cell (x, y) could still take (bit d-1 for
+        # digit d); 0 for filled cells
+        if self.grid[y][x]:
+            return 0
+        row, col, box = self.cell_units[(x, y)]
+        return self.all_digits & ~(self.masks[row] | self.masks[col] | self.masks[box])
+
+    def is_solved(self):
+        # Full with no clashes is a valid solution
+        return self.empty == 0 and not self.conflicts
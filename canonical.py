@@ -0,0 +1,163 @@
+import hashlib
+import os
+from itertools import permutations, product
+
+import numpy as np
+
+# -----------------------------
+# Canonical form
+# -----------------------------
+# Two puzzles are the same puzzle if one maps to the other by some mix of
+# transposition, band/stack swaps, row/column swaps inside a band/stack
+# and digit relabeling. The canonical form is the lexicographically
+# smallest grid (row-major, 0 for blanks) over that whole group.
+#
+# Rather than trying all 3,359,232 cell arrangements, rows are fixed one
+# at a time: every arrangement that ties for the smallest row so far is
+# kept, all others are dropped. Digits are relabeled in order of first
+# appearance, which is the smallest labeling for a fixed arrangement.
+# Relabeled, a first row reads 0s and 1, 2, 3... in order, so it only
+# depends on where the blanks are: all 2 x 9 x 1296 options are ranked
+# with one lookup in _PATTERN_RANK, and only the tied arrangements are
+# carried on to the later rows.
+
+_PERMS3 = list(permutations(range(3)))
+COLUMN_PERMS = np.array([
+    [stack * 3 + col for stack in stacks for col in inner[stack]]
+    for stacks in _PERMS3
+    for inner in product(_PERMS3, repeat=3)
+])
+_ROW_WEIGHTS = 10 ** np.arange(8, -1, -1, dtype=np.int64)
+_BIT_WEIGHTS = 1 << np.arange(8, -1, -1, dtype=np.int64)
+
+# _PATTERN_RANK[m, p]: the 9-bit given/blank pattern m of a row (bit 8 is
+# column 0) after column permutation p, read as a binary number
+_PATTERN_RANK = (
+    ((np.arange(512)[:, None] >> np.arange(8, -1, -1)) & 1).astype(np.int16)[:, COLUMN_PERMS]
+    * _BIT_WEIGHTS.astype(np.int16)
+).sum(axis=2)
+
+
+# Tied arrangements are merged (see _merge_ties) after a row that left
+# more of them than it started with, once there are more than this;
+# generated puzzles almost never get there
+_MERGE_ABOVE = 4096
+
+
+def canonical_form(puzzle):
+    puzzle = np.asarray(puzzle, dtype=np.int64).reshape(9, 9)
+    grids = np.stack([puzzle, puzzle.T])
+
+    # First row: the blank pattern decides, see _PATTERN_RANK
+    ranks = _PATTERN_RANK[(grids != 0).astype(np.int64) @ _BIT_WEIGHTS]
+    which, first_row, perm = np.nonzero(ranks == ranks.min())
+    used = np.zeros((len(which), 9), dtype=bool)
+    band = np.zeros(len(which), dtype=np.int64)
+    labels = np.zeros((len(which), 10), dtype=np.int64)
+    next_label = np.zeros(len(which), dtype=np.int64)
+
+    canon = np.zeros((9, 9), dtype=np.int64)
+    row_band = np.arange(9) // 3
+    for step in range(9):
+        # Which row may come next for each surviving arrangement
+        if step == 0:
+            state, row = np.arange(len(which)), first_row
+        elif step % 3 == 0:
+            band_used = used.reshape(-1, 3, 3).any(axis=2)
+            allowed = ~band_used[:, row_band]
+        else:
+            allowed = ~used & (row_band[None, :] == band[:, None])
+        if step:
+            state, row = np.nonzero(allowed)
+
+        before = len(which)
+        cells = np.take_along_axis(grids[which[state], row], COLUMN_PERMS[perm[state]], axis=1)
+        relabeled = np.take_along_axis(labels[state], cells, axis=1)
+        fresh = (cells > 0) & (relabeled == 0)
+        relabeled = np.where(fresh, next_label[state, None] + np.cumsum(fresh, axis=1), relabeled)
+
+        key = relabeled @ _ROW_WEIGHTS
+        keep = key == key.min()
+        state, row, cells = state[keep], row[keep], cells[keep]
+        relabeled, fresh = relabeled[keep], fresh[keep]
+        canon[step] = relabeled[0]
+
+        which, perm = which[state], perm[state]
+        used = used[state]
+        used[np.arange(len(state)), row] = True
+        band = row_band[row]
+        labels = labels[state]
+        np.put_along_axis(labels, cells, relabeled, axis=1)
+        next_label = next_label[state] + fresh.sum(axis=1)
+
+        if len(which) > max(before, _MERGE_ABOVE):
+            which, perm, used, band, labels, next_label = _merge_ties(
+                grids, which, perm, used, band, labels, next_label)
+
+    return canon
+
+
+def _merge_ties(grids, which, perm, used, band, labels, next_label):
+    # Drops arrangements whose remaining steps would go exactly like an
+    # earlier one's: same rows used, same band, same next label and the
+    # same unused rows once columns are permuted and digits relabeled
+    # (unlabeled digits kept as themselves, offset past 9). On symmetric
+    # input (an empty or nearly empty grid, a full solution) ties
+    # otherwise multiply with every row, into the millions.
+    cells = np.take_along_axis(grids[which], COLUMN_PERMS[perm][:, None, :], axis=2).reshape(len(which), 81)
+    mapped = np.take_along_axis(labels, cells, axis=1)
+    mapped = np.where((mapped == 0) & (cells > 0), cells + 10, mapped)
+    mapped = mapped.reshape(-1, 9, 9) * ~used[:, :, None]
+    signature = np.hstack([mapped.reshape(len(which), 81), used, band[:, None], next_label[:, None]])
+    # Every entry is below 20; one byte each, compared as whole rows
+    signature = np.ascontiguousarray(signature.astype(np.uint8))
+    _, first = np.unique(signature.view(f"V{signature.shape[1]}").ravel(), return_index=True)
+    return which[first], perm[first], used[first], band[first], labels[first], next_label[first]
+
+
+def puzzle_hash(puzzle):
+    # 16-byte digest of the canonical form
+    return hashlib.blake2b(canonical_form(puzzle).astype(np.uint8).tobytes(), digest_size=16).digest()
+
+
+# -----------------------------
+# Persistent dedup index
+# -----------------------------
+
+class DedupIndex:
+    # Append-only file of puzzle hashes, mirrored in a set for lookups.
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.hashes = set()
+        if os.path.exists(filename):
+            with open(filename, "rb") as f:
+                data = f.read()
+            whole = len(data) - len(data) % 16  # ignore a torn last entry
+            self.hashes.update(data[i:i + 16] for i in range(0, whole, 16))
+            if whole != len(data):
+                with open(filename, "r+b") as f:
+                    f.truncate(whole)
+        self.f = open(filename, "ab")
+
+    def __contains__(self, digest):
+        return digest in self.hashes
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def add(self, digest):
+        # Returns False if the hash was already indexed
+        if digest in self.hashes:
+            return False
+        self.hashes.add(digest)
+        self.f.write(digest)
+        return True
+
+    def sync(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def close(self):
+        self.sync()
+        self.f.close()
@@ -0,0 +1,52 @@
+# -----------------------------
+# Logical hints
+# -----------------------------
+# Finds the next cell that follows from the board by a simple technique,
+# using the candidates BoardState keeps up to date. Naked singles are
+# tried first, then hidden singles by box, row and column; the first hit
+# in scan order wins, so the same board always gives the same hint. A
+# full scan is a few thousand bit operations, well inside one frame (and
+# still only a few milliseconds on a 25x25 board).
+
+NAKED_SINGLE = "naked single"
+HIDDEN_SINGLE = {"box": "hidden single in box", "row": "hidden single in row", "column": "hidden single in column"}
+
+
+def _unit_kinds(size):
+    # (kind, first unit, last unit + 1), box first as a player would look
+    return [("box", 2 * size, 3 * size), ("row", 0, size), ("column", size, 2 * size)]
+
+
+def candidate_digits(mask):
+    return [d + 1 for d in range(mask.bit_length()) if mask >> d & 1]
+
+
+def find_hint(board):
+    # Returns (x, y, digit, technique), or None if neither technique
+    # applies (or the board already contradicts itself)
+    candidates = {}
+    for (x, y) in board.cell_units:
+        if board.grid[y][x]:
+            continue
+        mask = board.candidates(x, y)
+        if mask & (mask - 1) == 0:
+            if mask == 0:
+                return None  # a cell with no options: nothing sound to deduce
+            return x, y, mask.bit_length(), NAKED_SINGLE
+        candidates[(x, y)] = mask
+
+    for kind, first, last in _unit_kinds(board.size):
+        for unit in range(first, last):
+            seen_once = 0
+            seen_twice = 0
+            for cell in board.unit_cells[unit]:
+                mask = candidates.get(cell, 0)
+                seen_twice |= seen_once & mask
+                seen_once |= mask
+            single = seen_once & ~seen_twice
+            if single:
+                bit = single & -single
+                for cell in board.unit_cells[unit]:
+                    if candidates.get(cell, 0) & bit:
+                        return cell[0], cell[1], bit.bit_length(), HIDDEN_SINGLE[kind]
+    return None
@@ -2,13 +2,50 @@ import numpy as np
 import random
 import pickle
 import multiprocessing as mp
+import argparse
+import cProfile
 import os
+import time
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache, partial
+from multiprocessing import shared_memory
+
+import canonical
+import puzzle_store
+import telemetry
+
+# -----------------------------
+# Worker instrumentation
+# -----------------------------
+# Off unless a pool is started with telemetry (see _init_worker); then
+# _stage() times named stages of each puzzle in this process.
+
+_timer = None
+_profiler = None
+_profile_dir = None
+_shared = None  # record buffer attached by _init_worker (see _shared_buffer)
+
+
+def _stage(name):
+    return _timer.stage(name) if _timer is not None else nullcontext()
+
+
+def _init_worker(instrument=False, profile_dir=None, shared_name=None):
+    global _timer, _profiler, _profile_dir, _shared
+    _timer = telemetry.StageTimer() if instrument else None
+    _profiler = cProfile.Profile() if profile_dir else None
+    _profile_dir = profile_dir
+    if shared_name is not None:
+        _shared = shared_memory.SharedMemory(name=shared_name)
+
 
 # -----------------------------
 # Sudoku generator functions
 # -----------------------------
 
-def generate_full_solution():
+def generate_full_solution(box=3):
+    if box != 3:
+        return _shuffled_solution(box)
     grid = np.zeros((9,9), dtype=int)
     rows = [set() for _ in range(9)]
     cols = [set() for _ in range(9)]
@@ -45,67 +82,655 @@ def generate_full_solution():
     return grid
 
 
-def solve_and_count(grid, limit=2):
+def _shuffled_solution(box):
+    # Cell-by-cell backtracking from an empty grid stalls on 16x16 and
+    # never finishes on 25x25, so bigger boards start from the standard
+    # pattern grid and are shuffled with validity-preserving moves: bands
+    # and the rows inside each band, stacks and the columns inside each
+    # stack, an optional transpose and a digit relabeling.
+    size = box * box
+    r = np.arange(size)
+    pattern = (box * (r[:, None] % box) + r[:, None] // box + r[None, :]) % size
+
+    def order():
+        return [band * box + i for band in random.sample(range(box), box) for i in random.sample(range(box), box)]
+
+    grid = pattern[np.ix_(order(), order())]
+    if random.random() < 0.5:
+        grid = grid.T
+    digits = np.array(random.sample(range(1, size + 1), size))
+    return digits[grid]
+
+
+# -----------------------------
+# Bitmask constraint solver
+# -----------------------------
+# Cells are indexed 0..80 in row-major order and digits are stored as
+# single bits (digit d -> 1 << (d - 1)), so a row/column/box "used" set
+# is one 9-bit int and a cell's candidates are a single AND-NOT.
+#
+# Nothing here is specific to 9x9: the same search runs on any
+# (box*box) x (box*box) board from the tables _geometry(box) returns.
+# Masks are just wider (16 or 25 bits), and MRV plus singles keep 16x16
+# and 25x25 boards practical where plain backtracking never finishes.
+
+
+class _BitCount:
+    # popcount for masks too wide for a lookup table
+    def __getitem__(self, mask):
+        return bin(mask).count("1")
+
+
+@lru_cache(maxsize=None)
+def _geometry(box):
+    # (size, cells, all digits mask, row, col, box of each cell, units,
+    # popcount) for a board of box x box boxes; units are all rows, then
+    # all columns, then all boxes
+    size = box * box
+    cells = size * size
+    row = [i // size for i in range(cells)]
+    col = [i % size for i in range(cells)]
+    box_of = [(i // (size * box)) * box + (i % size) // box for i in range(cells)]
+    units = (
+        [[r * size + c for c in range(size)] for r in range(size)]
+        + [[r * size + c for r in range(size)] for c in range(size)]
+        + [[i for i in range(cells) if box_of[i] == b] for b in range(size)]
+    )
+    all_digits = (1 << size) - 1
+    popcount = [bin(m).count("1") for m in range(all_digits + 1)] if size <= 16 else _BitCount()
+    return size, cells, all_digits, row, col, box_of, units, popcount
+
+
+def grid_box(grid):
+    # Box size of a square grid: 3 for 9x9, 4 for 16x16, 5 for 25x25
+    cells = np.size(grid)
+    box = round(cells ** 0.25)
+    if box ** 4 != cells:
+        raise ValueError(f"A grid of {cells} cells is not a (box*box) x (box*box) board")
+    return box
+
+
+_GEO = _geometry(3)
+_ROW, _COL, _BOX, _UNITS = _GEO[3:7]
+
+
+def _load_grid(grid, geo=_GEO):
+    # Returns (vals, rows, cols, boxes) or None if the givens clash.
+    size, cells, _, row_of, col_of, box_of = geo[:6]
+    vals = [0] * cells
+    rows = [0] * size
+    cols = [0] * size
+    boxes = [0] * size
+    for i, val in enumerate(np.asarray(grid).ravel().tolist()):
+        if val == 0:
+            continue
+        bit = 1 << (val - 1)
+        r, c, b = row_of[i], col_of[i], box_of[i]
+        if (rows[r] | cols[c] | boxes[b]) & bit:
+            return None
+        vals[i] = bit
+        rows[r] |= bit
+        cols[c] |= bit
+        boxes[b] |= bit
+    return vals, rows, cols, boxes
+
+
+def _propagate(vals, rows, cols, boxes, stats=None, geo=_GEO):
+    # Fills naked and hidden singles in place until nothing changes.
+    # Returns (ok, cell, mask): ok is False on a contradiction, otherwise
+    # cell is the empty cell with the fewest candidates (MRV) and mask its
+    # candidates, or cell is None when the grid is full.
+    size, cells, all_digits, row_of, col_of, box_of, units, popcount = geo
+    naked = hidden_found = 0
+    try:
+        while True:
+            progress = False
+            cands = [0] * cells
+            best, best_mask, best_count = None, 0, size + 1
+
+            for i in range(cells):
+                if vals[i]:
+                    continue
+                r, c, b = row_of[i], col_of[i], box_of[i]
+                mask = all_digits & ~(rows[r] | cols[c] | boxes[b])
+                if not mask:
+                    return False, None, 0
+                if not mask & (mask - 1):
+                    # Naked single
+                    vals[i] = mask
+                    rows[r] |= mask
+                    cols[c] |= mask
+                    boxes[b] |= mask
+                    naked += 1
+                    progress = True
+                    continue
+                cands[i] = mask
+                n = popcount[mask]
+                if n < best_count:
+                    best, best_mask, best_count = i, mask, n
+
+            if progress:
+                continue
+            if best is None:
+                return True, None, 0
+
+            for unit in units:
+                once = twice = placed = 0
+                for i in unit:
+                    if vals[i]:
+                        placed |= vals[i]
+                    else:
+                        twice |= once & cands[i]
+                        once |= cands[i]
+                if (once | placed) != all_digits:
+                    return False, None, 0
+                hidden = once & ~twice & ~placed
+                if not hidden:
+                    continue
+                for i in unit:
+                    if vals[i] or not cands[i] & hidden:
+                        continue
+                    # Hidden single
+                    bit = cands[i] & hidden
+                    r, c, b = row_of[i], col_of[i], box_of[i]
+                    if bit & (bit - 1) or (rows[r] | cols[c] | boxes[b]) & bit:
+                        return False, None, 0
+                    vals[i] = bit
+                    rows[r] |= bit
+                    cols[c] |= bit
+                    boxes[b] |= bit
+                    hidden_found += 1
+                    progress = True
+
+            if not progress:
+                return True, best, best_mask
+    finally:
+        if stats is not None:
+            stats["naked_singles"] += naked
+            stats["hidden_singles"] += hidden_found
+
+
+def new_stats():
+    # Solver effort counters, filled in by any solver given stats=
+    return dict.fromkeys(puzzle_store.METRIC_FIELDS, 0)
+
+
+def _count_from(state, limit, stats=None, found=None, geo=_GEO, budget=None):
+    # Counts solutions reachable from a loaded (vals, rows, cols, boxes)
+    # state, stopping once limit is reached. state is consumed. If found
+    # is a list, the first solution's digits are appended to it. With a
+    # budget, the search gives up after that many nodes and returns limit,
+    # as if it had found that many.
+    row_of, col_of, box_of = geo[3:6]
     count = 0
-    rows = [set() for _ in range(9)]
-    cols = [set() for _ in range(9)]
-    boxes = [set() for _ in range(9)]
 
-    def box_index(r, c):
-        return (r // 3) * 3 + (c // 3)
+    def search(vals, rows, cols, boxes, depth=0):
+        nonlocal count, budget
+        if budget is not None:
+            budget -= 1
+            if budget < 0:
+                count = limit
+                return
+        if stats is not None:
+            stats["nodes"] += 1
+            stats["max_depth"] = max(stats["max_depth"], depth)
+        ok, cell, mask = _propagate(vals, rows, cols, boxes, stats, geo)
+        if not ok:
+            if stats is not None:
+                stats["backtracks"] += 1
+            return
+        if cell is None:
+            if found is not None and not count:
+                found.extend(bit.bit_length() for bit in vals)
+            count += 1
+            return
+
+        r, c, b = row_of[cell], col_of[cell], box_of[cell]
+        while mask and count < limit:
+            bit = mask & -mask
+            mask ^= bit
+            if stats is not None:
+                stats["guesses"] += 1
+            next_vals, next_rows = vals[:], rows[:]
+            next_cols, next_boxes = cols[:], boxes[:]
+            next_vals[cell] = bit
+            next_rows[r] |= bit
+            next_cols[c] |= bit
+            next_boxes[b] |= bit
+            search(next_vals, next_rows, next_cols, next_boxes, depth + 1)
+
+    search(*state)
+    return count
+
+
+def solve_and_count(grid, limit=2, stats=None):
+    # Counts solutions of grid, stopping once limit is reached.
+    # grid is not modified. Pass stats (see new_stats) to collect effort.
+    # Any board size works (see grid_box).
+    geo = _geometry(grid_box(grid))
+    state = _load_grid(grid, geo)
+    if state is None:
+        return 0
+    return _count_from(state, limit, stats, geo=geo)
+
+
+def solve(grid, limit=2, stats=None):
+    # Like solve_and_count, but returns (count, solution) where solution
+    # is the first solution found as a flat list of digits, or None if
+    # there is none
+    geo = _geometry(grid_box(grid))
+    state = _load_grid(grid, geo)
+    if state is None:
+        return 0, None
+    found = []
+    count = _count_from(state, limit, stats, found, geo)
+    return count, found or None
+
+
+# -----------------------------
+# Exact-cover (Algorithm X) solver
+# -----------------------------
+# Sudoku as exact cover: 729 candidate rows (cell, digit), each covering
+# four of 324 constraint columns -- cell filled, digit in row, digit in
+# column, digit in box. This is Knuth's Dancing Links: every 1 in the
+# matrix is a node in circular doubly linked lists across its row and
+# down its column, held in flat lists (left, right, up, down, column of
+# each node). Covering a column unlinks it and every row through it in
+# place, and uncovering relinks them in exactly the reverse order, so the
+# search never copies anything. It always covers the column with the
+# fewest remaining rows.
+#
+# In pure Python it still trails the bitmask solver, on the hard corpus
+# as well, and setting up the links costs about 0.5 ms a call, which
+# makes it slow for digging. It is kept as an independent cross-check
+# of solution counts (see benchmark.py), not as a way to cap latency.
+#
+# Node 0 is the root, column j has its header at node j + 1, and
+# candidate row r has its four nodes at _DLX_FIRST + 4 * r onwards.
+
+_DLX_ROWS = []
+for _i in range(81):
+    for _d in range(9):
+        _DLX_ROWS.append((
+            _i,
+            81 + _ROW[_i] * 9 + _d,
+            162 + _COL[_i] * 9 + _d,
+            243 + _BOX[_i] * 9 + _d,
+        ))
+del _i, _d
+
+_DLX_FIRST = 325
+
+
+def _dlx_links():
+    n = _DLX_FIRST + 4 * len(_DLX_ROWS)
+    left, right = [0] * n, [0] * n
+    up, down = list(range(n)), list(range(n))
+    column, sizes = list(range(n)), [0] * _DLX_FIRST
+    for h in range(_DLX_FIRST):
+        left[h] = (h - 1) % _DLX_FIRST
+        right[h] = (h + 1) % _DLX_FIRST
+    for r, columns in enumerate(_DLX_ROWS):
+        first = _DLX_FIRST + 4 * r
+        for k, j in enumerate(columns):
+            node, h = first + k, j + 1
+            left[node] = first + (k - 1) % 4
+            right[node] = first + (k + 1) % 4
+            column[node] = h
+            up[node], down[node] = up[h], h
+            down[up[h]] = node
+            up[h] = node
+            sizes[h] += 1
+    return left, right, up, down, column, sizes
+
+
+_DLX_LINKS = _dlx_links()
 
-    for r in range(9):
-        for c in range(9):
-            val = grid[r, c]
-            if val != 0:
-                rows[r].add(val)
-                cols[c].add(val)
-                boxes[box_index(r, c)].add(val)
 
-    def backtrack(r=0, c=0):
+def solve_and_count_dlx(grid, limit=2, stats=None):
+    # Same contract as solve_and_count, using the exact-cover backend.
+    left, right, up, down, column, sizes = (list(a) for a in _DLX_LINKS)
+
+    def cover(c):
+        right[left[c]] = right[c]
+        left[right[c]] = left[c]
+        i = down[c]
+        while i != c:
+            j = right[i]
+            while j != i:
+                down[up[j]] = down[j]
+                up[down[j]] = up[j]
+                sizes[column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def uncover(c):
+        i = up[c]
+        while i != c:
+            j = left[i]
+            while j != i:
+                sizes[column[j]] += 1
+                down[up[j]] = j
+                up[down[j]] = j
+                j = left[j]
+            i = up[i]
+        right[left[c]] = c
+        left[right[c]] = c
+
+    for i, val in enumerate(np.asarray(grid).ravel().tolist()):
+        if val == 0:
+            continue
+        node = _DLX_FIRST + 4 * (i * 9 + val - 1)
+        # A given clashes when one of its columns is already covered
+        if any(right[left[column[node + k]]] != column[node + k] for k in range(4)):
+            return 0
+        for k in range(4):
+            cover(column[node + k])
+    count = 0
+
+    def search(depth=0):
         nonlocal count
-        if r == 9:
+        c = right[0]
+        if c == 0:
             count += 1
             return
-        if count >= limit:
+        best, fewest = c, sizes[c]
+        while c and fewest:
+            if sizes[c] < fewest:
+                best, fewest = c, sizes[c]
+            c = right[c]
+        if stats is not None:
+            # A one-row column is a forced move: a cell with one candidate
+            # (naked single) or a unit with one place for a digit (hidden)
+            stats["nodes"] += 1
+            stats["max_depth"] = max(stats["max_depth"], depth)
+            if not fewest:
+                stats["backtracks"] += 1
+            elif fewest == 1:
+                stats["naked_singles" if best <= 81 else "hidden_singles"] += 1
+            else:
+                stats["guesses"] += fewest
+        if not fewest:
             return
+        branch = depth + (fewest > 1)
+        cover(best)
+        r = down[best]
+        while r != best:
+            j = right[r]
+            while j != r:
+                cover(column[j])
+                j = right[j]
+            search(branch)
+            j = left[r]
+            while j != r:
+                uncover(column[j])
+                j = left[j]
+            if count >= limit:
+                break
+            r = down[r]
+        uncover(best)
+
+    search()
+    return count
 
-        next_r, next_c = (r, c + 1) if c < 8 else (r + 1, 0)
 
-        if grid[r, c] != 0:
-            backtrack(next_r, next_c)
+# -----------------------------
+# Batch solver (NumPy)
+# -----------------------------
+# Propagates many puzzles at once on an (N, 81, 9) boolean candidate
+# tensor. Peer and unit incidence are fixed 0/1 matrices, so eliminating
+# placed digits and counting a digit's places in each unit are single
+# matmuls across the whole batch.
+
+_PEER_MATRIX = np.zeros((81, 81), dtype=np.float32)
+_UNIT_MATRIX = np.zeros((27, 81), dtype=np.float32)
+for _u, _unit in enumerate(_UNITS):
+    _PEER_MATRIX[np.ix_(_unit, _unit)] = 1
+    _UNIT_MATRIX[_u, _unit] = 1
+np.fill_diagonal(_PEER_MATRIX, 0)
+del _u, _unit
+
+
+def _batch_propagate(cand):
+    # Applies naked and hidden singles to cand in place until it stops
+    # changing. Returns a bool array marking puzzles with a contradiction.
+    dead = np.zeros(len(cand), dtype=bool)
+    while True:
+        counts = cand.sum(axis=2)
+        fixed = cand & (counts == 1)[:, :, None]
+        seen = np.matmul(_PEER_MATRIX, fixed.astype(np.float32)) > 0
+        dead |= (counts == 0).any(axis=1)
+        dead |= (fixed & seen).any(axis=(1, 2))
+        new = cand & ~seen
+
+        places = np.matmul(_UNIT_MATRIX, new.astype(np.float32))
+        dead |= (places == 0).any(axis=(1, 2))
+        hidden = np.matmul(_UNIT_MATRIX.T, (places == 1).astype(np.float32)) > 0
+        hidden &= new
+        hidden_count = hidden.sum(axis=2)
+        dead |= (hidden_count > 1).any(axis=1)
+        new = np.where((hidden_count == 1)[:, :, None], hidden, new)
+
+        new[dead] = cand[dead]
+        if np.array_equal(new, cand):
+            return dead
+        cand[...] = new
+
+
+def solve_batch(puzzles, limit=2, stats=None):
+    # Counts solutions (capped at limit) for an (N, 9, 9) stack of puzzles.
+    # Puzzles that propagation alone cannot settle fall back to
+    # solve_and_count, seeded with everything propagation has placed;
+    # stats only covers that fallback search.
+    puzzles = np.asarray(puzzles).reshape(-1, 81)
+    cand = np.ones((len(puzzles), 81, 9), dtype=bool)
+    given = puzzles > 0
+    cand[given] = np.eye(9, dtype=bool)[puzzles[given] - 1]
+
+    dead = _batch_propagate(cand)
+    counts = np.zeros(len(puzzles), dtype=int)
+    solved = (cand.sum(axis=2) == 1).all(axis=1) & ~dead
+    counts[solved] = min(limit, 1)
+
+    for n in np.flatnonzero(~solved & ~dead):
+        single = cand[n].sum(axis=1) == 1
+        grid = np.where(single, cand[n].argmax(axis=1) + 1, 0)
+        counts[n] = solve_and_count(grid, limit, stats)
+    return counts
+
+
+def solve_and_count_batch(grid, limit=2, stats=None):
+    # Single-puzzle entry point for the batch backend.
+    return int(solve_batch(np.asarray(grid)[None], limit, stats)[0])
+
+
+SOLVERS = {
+    "bitmask": solve_and_count,
+    "dlx": solve_and_count_dlx,
+    "batch": solve_and_count_batch,
+}
+
+
+def get_solver(solver="bitmask", difficulty=None):
+    # solver is a backend name, or a dict mapping difficulty -> name so
+    # each difficulty can use whichever backend is faster for it.
+    if isinstance(solver, dict):
+        solver = solver.get(difficulty, "bitmask")
+    try:
+        return SOLVERS[solver]
+    except KeyError:
+        raise ValueError(f"Unknown solver '{solver}', expected one of {sorted(SOLVERS)}") from None
+
+
+def dig_batch(puzzles, positions, min_clues):
+    # Digs a stack of 9x9 puzzles in lockstep, each through its own list
+    # of positions. Every solve_batch call carries one trial removal per
+    # puzzle still digging, so each position is tried once, as in the
+    # one-at-a-time loop, and each puzzle comes out exactly as that loop
+    # would dig it; the interpreter and NumPy overhead of a call is shared
+    # by the whole stack instead.
+    puzzles = np.array(puzzles)
+    clues = np.count_nonzero(puzzles, axis=(1, 2))
+    lengths = np.array([len(p) for p in positions])
+    for step in range(lengths.max(initial=0)):
+        active = np.flatnonzero((clues > min_clues) & (lengths > step))
+        if not len(active):
+            break
+        rows, cols = zip(*(positions[n][step] for n in active))
+        trials = puzzles[active]
+        trials[np.arange(len(active)), rows, cols] = 0
+
+        with _stage("unique"):
+            unique = solve_batch(trials, limit=2) == 1
+        puzzles[active[unique]] = trials[unique]
+        clues[active[unique]] -= 1
+
+    return puzzles
+
+
+def _dig_incremental(puzzle, positions, min_clues, budget=None, nodes=None):
+    # Digs with one set of row/column/box masks kept across removals
+    # instead of re-solving a fresh copy each time. The full solution is a
+    # known witness, so a removal is safe exactly when no solution puts a
+    # different digit in the emptied cell: only that cell and its units
+    # need a look, and a search only runs when singles cannot decide it.
+    # Every position is decided once; a failed removal stays failed since
+    # removing clues only adds solutions.
+    #
+    # With a budget, a removal is instead kept only if counting the whole
+    # puzzle's solutions still finishes within budget nodes, so solving
+    # the finished puzzle never takes more; a count that runs out keeps
+    # the clue. budget=0 skips the search: naked and hidden singles alone
+    # must fill the board, which proves uniqueness without any guessing.
+    # On 16x16 and 25x25 boards, where an unbounded uniqueness search can
+    # run for minutes, that keeps digging to a second or two. nodes caps
+    # the search over the whole dig; once spent, the remaining clues stay.
+    geo = _geometry(grid_box(puzzle))
+    size, _, all_digits, row_of, col_of, box_of, units = geo[:7]
+    vals, rows, cols, boxes = _load_grid(puzzle, geo)
+    clues = np.count_nonzero(puzzle)
+    spent = new_stats()
+
+    for r, c in positions:
+        if nodes is not None and spent["nodes"] >= nodes:
+            break
+        i = r * size + c
+        bit = vals[i]
+        b = box_of[i]
+        vals[i] = 0
+        rows[r] &= ~bit
+        cols[c] &= ~bit
+        boxes[b] &= ~bit
+
+        with _stage("unique"):
+            others = all_digits & ~(rows[r] | cols[c] | boxes[b]) & ~bit
+            safe = not others
+            if not safe:
+                # Hidden single: some unit has nowhere else to put the digit
+                for unit in (units[r], units[size + c], units[2 * size + b]):
+                    if not any(
+                        j != i and not vals[j]
+                        and not (rows[row_of[j]] | cols[col_of[j]] | boxes[box_of[j]]) & bit
+                        for j in unit
+                    ):
+                        safe = True
+                        break
+            if not safe and budget == 0:
+                ok, cell, _ = _propagate(vals[:], rows[:], cols[:], boxes[:], geo=geo)
+                safe = ok and cell is None
+            elif not safe and budget is not None:
+                allowed = budget if nodes is None else min(budget, nodes - spent["nodes"])
+                safe = _count_from((vals[:], rows[:], cols[:], boxes[:]), 2, spent, geo=geo, budget=allowed) == 1
+            elif not safe:
+                # Safe once every other digit for the cell is refuted
+                safe = True
+                while others:
+                    alt = others & -others
+                    others ^= alt
+                    trial = vals[:], rows[:], cols[:], boxes[:]
+                    trial[0][i] = alt
+                    trial[1][r] |= alt
+                    trial[2][c] |= alt
+                    trial[3][b] |= alt
+                    if _count_from(trial, 1, geo=geo):
+                        safe = False
+                        break
+
+        if safe:
+            puzzle[r, c] = 0
+            clues -= 1
         else:
-            for val in range(1, 10):
-                if val not in rows[r] and val not in cols[c] and val not in boxes[box_index(r, c)]:
-                    grid[r, c] = val
-                    rows[r].add(val)
-                    cols[c].add(val)
-                    boxes[box_index(r, c)].add(val)
+            vals[i] = bit
+            rows[r] |= bit
+            cols[c] |= bit
+            boxes[b] |= bit
 
-                    backtrack(next_r, next_c)
+        if clues <= min_clues:
+            break
 
-                    grid[r, c] = 0
-                    rows[r].remove(val)
-                    cols[c].remove(val)
-                    boxes[box_index(r, c)].remove(val)
+    return puzzle
 
-    backtrack()
-    return count
 
+# Search allowed when digging boards other than 9x9, by box size and
+# difficulty, as (nodes a removal's uniqueness check may take, nodes for
+# the whole dig); see make_puzzle_from_solution. Easy and medium stay
+# solvable by singles. A 25x25 node costs about three 16x16 ones, so its
+# budgets are smaller to keep digging to a few seconds.
+BIG_BOARD_BUDGETS = {
+    4: {"hard": (20, 3000), "expert": (100, 10000)},
+    5: {"hard": (10, 2000), "expert": (20, 3000)},
+}
 
-def make_puzzle_from_solution(solution, difficulty="medium"):
-    puzzle = solution.copy()
+
+def target_clues(difficulty, size=9):
+    # Clue counts are for 81 cells; bigger boards keep the same share
     levels = {"easy": 36, "medium": 32, "hard": 28, "expert": 24}
-    min_clues = levels.get(difficulty, 32)
+    return round(levels.get(difficulty, 32) * size * size / 81)
+
 
-    positions = [(r, c) for r in range(9) for c in range(9)]
+def dig_order(size=9):
+    # Every cell of a size x size board, in the random order digging
+    # tries them
+    positions = [(r, c) for r in range(size) for c in range(size)]
     random.shuffle(positions)
+    return positions
+
+
+def make_puzzle_from_solution(solution, difficulty="medium", solver="bitmask", incremental=True):
+    # Boards other than 9x9 always dig incrementally with the bitmask
+    # solver, the only backend that handles them. A first pass keeps only
+    # removals singles can prove (see _dig_incremental); hard and expert
+    # then retry the cells it had to keep with a node-budgeted search, so
+    # they need guessing where easy and medium do not, expert more of it.
+    # Those budgets are what tells them apart: random digging bottoms out
+    # around 36% clues on 16x16 and 42% on 25x25 whatever the search,
+    # above both targets.
+    count_solutions = get_solver(solver, difficulty)
+    puzzle = solution.copy()
+    size = len(puzzle)
+    min_clues = target_clues(difficulty, size)
+    positions = dig_order(size)
+
+    if size != 9:
+        puzzle = _dig_incremental(puzzle, positions, min_clues, budget=0)
+        budgets = BIG_BOARD_BUDGETS.get(grid_box(puzzle), {})
+        if difficulty in budgets and np.count_nonzero(puzzle) > min_clues:
+            budget, nodes = budgets[difficulty]
+            kept = [(r, c) for r, c in positions if puzzle[r, c]]
+            puzzle = _dig_incremental(puzzle, kept, min_clues, budget, nodes)
+        return puzzle
+    if count_solutions is solve_and_count_batch:
+        return dig_batch(puzzle[None], [positions], min_clues)[0]
+    if incremental and count_solutions is solve_and_count:
+        return _dig_incremental(puzzle, positions, min_clues)
 
     for r, c in positions:
         temp = puzzle[r, c]
         puzzle[r, c] = 0
 
-        if solve_and_count(puzzle.copy(), limit=2) != 1:
+        with _stage("unique"):
+            unique = count_solutions(puzzle, limit=2) == 1
+        if not unique:
             puzzle[r, c] = temp
 
         if np.count_nonzero(puzzle) <= min_clues:
@@ -118,36 +743,348 @@ def make_puzzle_from_solution(solution, difficulty="medium"):
 # Worker function (ONE puzzle)
 # -----------------------------
 
-def generate_single_puzzle(difficulty):
-    solution = generate_full_solution()
-    puzzle = make_puzzle_from_solution(solution, difficulty)
-    return puzzle, solution
+def generate_single_puzzle(difficulty, solver="bitmask", box=3):
+    # Returns (puzzle, solution, metrics); metrics is the effort of one
+    # bitmask solve of the finished puzzle, kept for grade_puzzle. box 4
+    # and 5 give 16x16 and 25x25 boards.
+    with _stage("generate"):
+        solution = generate_full_solution(box)
+    with _stage("dig"):
+        puzzle = make_puzzle_from_solution(solution, difficulty, solver)
+    with _stage("metrics"):
+        metrics = new_stats()
+        solve_and_count(puzzle, limit=2, stats=metrics)
+    return puzzle, solution, metrics
+
+
+def generate_puzzles_batched(difficulty, count):
+    # count 9x9 (puzzle, solution, metrics) like generate_single_puzzle
+    # with the batch backend, but dug together by one dig_batch call, so
+    # every solve_batch call checks a candidate removal for each of them
+    with _stage("generate"):
+        solutions = [generate_full_solution() for _ in range(count)]
+    with _stage("dig"):
+        orders = [dig_order() for _ in range(count)]
+        puzzles = dig_batch(solutions, orders, target_clues(difficulty))
+    results = []
+    with _stage("metrics"):
+        for puzzle, solution in zip(puzzles, solutions):
+            metrics = new_stats()
+            solve_and_count(puzzle, limit=2, stats=metrics)
+            results.append((puzzle, solution, metrics))
+    return results
+
+
+def grade_puzzle(metrics):
+    # Difficulty from recorded solver effort, no solving needed: naked
+    # singles only is easy, needing hidden singles is medium, one level of
+    # guessing is hard, nested guessing is expert
+    if metrics["max_depth"] == 0:
+        return "easy" if metrics["hidden_singles"] == 0 else "medium"
+    return "hard" if metrics["max_depth"] == 1 else "expert"
+
+
+def _generate_job(difficulty, solver="bitmask", dedup=False):
+    # Pool task: one puzzle plus its canonical hash when deduplicating,
+    # hashed here so the parent process never becomes the bottleneck, and
+    # this puzzle's timings when the worker is instrumented
+    start = time.perf_counter()
+    if _profiler is not None:
+        _profiler.enable()
+    try:
+        result = generate_single_puzzle(difficulty, solver)
+        with _stage("hash"):
+            digest = canonical.puzzle_hash(result[0]) if dedup else None
+        elapsed = time.perf_counter() - start
+    finally:
+        if _profiler is not None:
+            _profiler.disable()
+            _profiler.dump_stats(telemetry.profile_path(_profile_dir))
+
+    info = None
+    if _timer is not None:
+        info = {"pid": os.getpid(), "elapsed": elapsed, "stages": _timer.take()}
+    return result, digest, info
+
+
+def _generate_shared_job(job, solver="bitmask", dedup=False):
+    # Like _generate_job, but the puzzle is packed straight into slot of
+    # the shared record buffer and only the slot number goes back
+    difficulty, slot = job
+    result, digest, info = _generate_job(difficulty, solver, dedup)
+    size = puzzle_store.RECORD_SIZE
+    _shared.buf[slot * size:(slot + 1) * size] = puzzle_store.pack_records([result]).tobytes()
+    return slot, digest, info
+
+
+def _generate_batch_job(job, dedup=False):
+    # Pool task for the batch backend: job is (difficulty, slots) and
+    # len(slots) puzzles are made by generate_puzzles_batched. Returns a
+    # list of what _generate_job or, with the shared record buffer,
+    # _generate_shared_job returns for each; the task's time is split
+    # evenly between its puzzles and its stage timings go with the first
+    difficulty, slots = job
+    start = time.perf_counter()
+    if _profiler is not None:
+        _profiler.enable()
+    try:
+        results = generate_puzzles_batched(difficulty, len(slots))
+        with _stage("hash"):
+            digests = [canonical.puzzle_hash(result[0]) if dedup else None for result in results]
+        elapsed = time.perf_counter() - start
+    finally:
+        if _profiler is not None:
+            _profiler.disable()
+            _profiler.dump_stats(telemetry.profile_path(_profile_dir))
+
+    stages = _timer.take() if _timer is not None else None
+    size = puzzle_store.RECORD_SIZE
+    done = []
+    for n, (slot, result, digest) in enumerate(zip(slots, results, digests)):
+        info = None
+        if _timer is not None:
+            info = {"pid": os.getpid(), "elapsed": elapsed / len(slots), "stages": stages if n == 0 else {}}
+        if _shared is not None:
+            _shared.buf[slot * size:(slot + 1) * size] = puzzle_store.pack_records([result]).tobytes()
+            result = slot
+        done.append((result, digest, info))
+    return done
 
 
 # -----------------------------
 # Multiprocessing driver
 # -----------------------------
 
-def precompute_puzzles(per_diff=100, filename="sudoku_puzzles.pkl"):
+def _iter_checkpoint(path):
+    # Yields (difficulty, results) for every complete chunk in a
+    # checkpoint file. A torn chunk at the end (crash or Ctrl-C mid-write)
+    # is cut off so appends resume from a clean record boundary.
+    if not os.path.exists(path):
+        return
+
+    good = 0
+    with open(path, "rb") as f:
+        while True:
+            try:
+                diff, results = pickle.load(f)
+            except EOFError:
+                break
+            except Exception as e:
+                print(f"Discarding damaged checkpoint tail at byte {good}: {e}")
+                break
+            good = f.tell()
+            yield diff, results
+
+    if good != os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(good)
+
+
+def _checkpoint_counts(path):
+    counts = {}
+    for diff, results in _iter_checkpoint(path):
+        counts[diff] = counts.get(diff, 0) + len(results)
+    return counts
+
+
+def _append_chunk(out, diff, results, index=None):
+    # results is a list of (puzzle, solution, metrics) or, from the
+    # shared-memory transport, an (n, RECORD_SIZE) array of packed
+    # records. The index goes to disk first so nothing in the checkpoint
+    # is ever missing from it
+    if index is not None:
+        index.f.flush()
+    out.write(pickle.dumps((diff, results), protocol=pickle.HIGHEST_PROTOCOL))
+    out.flush()
+
+
+# Shared-memory transport: record slots per worker in each wave
+_SLOTS_PER_CPU = 256
+
+# Puzzles one batch-backend task digs together (see dig_batch)
+_BATCH_PUZZLES = 128
+
+
+def _chunk(buffer, shm):
+    # Checkpoint payload for buffered results. Plain results stay a list.
+    # From shared memory, buffer holds slot numbers; a wave that kept every
+    # slot is a run from 0 and goes out as a view of the buffer, pickled
+    # straight from shared memory, otherwise (duplicates dropped, or
+    # interrupted) with one gather. The view only lives until pickled, so
+    # the buffer can always be closed.
+    if shm is None:
+        return buffer
+    records = np.frombuffer(shm.buf, dtype=np.uint8).reshape(-1, puzzle_store.RECORD_SIZE)
+    slots = np.sort(buffer)
+    if slots[-1] == len(slots) - 1:
+        return records[:len(slots)]
+    return records[slots]
+
+
+@contextmanager
+def _shared_buffer(slots):
+    # SharedMemory for slots packed records, unlinked on exit; None when
+    # slots is None
+    if slots is None:
+        yield None
+        return
+    shm = shared_memory.SharedMemory(create=True, size=slots * puzzle_store.RECORD_SIZE)
+    try:
+        yield shm
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _sync(out, index=None):
+    if index is not None:
+        index.sync()
+    os.fsync(out.fileno())
+
+
+def precompute_puzzles(per_diff=100, filename="sudoku_puzzles.bin", solver="bitmask",
+                       chunk_size=50, fsync_interval=30.0, resume=True, dedup=True,
+                       grade=False, instrument=False, profile_dir=None, shared=False):
+    # Finished puzzles are appended to <filename>.part in chunks of
+    # chunk_size as they arrive and fsynced at most every fsync_interval
+    # seconds, so an interrupted run keeps its work. With resume, a run
+    # only generates what the checkpoint is still missing. The final
+    # store (see puzzle_store) is written once every difficulty is
+    # complete, streamed from the checkpoint rather than held in memory.
+    # With dedup, puzzles whose canonical form is already in the
+    # persistent <name>.idx index (from this or any earlier run) are
+    # thrown away and regenerated. With grade, the final store files each
+    # puzzle under grade_puzzle of its recorded metrics instead of the
+    # difficulty it was generated for. instrument prints live progress and
+    # a per-stage/per-worker summary (see telemetry); profile_dir gets a
+    # cProfile dump from every worker. With shared, workers write packed
+    # records into a shared-memory buffer and only send back slot
+    # numbers, so results are never pickled on their way to this process;
+    # jobs then go out in waves no bigger than the buffer, and each wave
+    # goes to the checkpoint as one chunk read straight from the buffer.
     difficulties = ["easy", "medium", "hard", "expert"]
-    all_puzzles = {d: [] for d in difficulties}
+    checkpoint = filename + ".part"
+    if not resume and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    done = _checkpoint_counts(checkpoint)
+    index = canonical.DedupIndex(os.path.splitext(filename)[0] + ".idx") if dedup else None
 
     cpu_count = mp.cpu_count()
     print(f"Using {cpu_count} CPU cores")
 
-    with mp.Pool(processes=cpu_count) as pool:
+    stats = telemetry.Telemetry() if instrument else None
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+    wave = cpu_count * _SLOTS_PER_CPU if shared else None
+
+    with _shared_buffer(wave) as shm, open(checkpoint, "ab") as out, mp.Pool(
+        processes=cpu_count, initializer=_init_worker,
+        initargs=(instrument, profile_dir, shm.name if shm is not None else None),
+    ) as pool:
+        last_sync = time.monotonic()
         for diff in difficulties:
-            print(f"\nGenerating {per_diff} puzzles for {diff}...")
+            missing = per_diff - done.get(diff, 0)
+            if missing <= 0:
+                print(f"\n{diff}: {done[diff]} puzzles already in checkpoint")
+                continue
+            print(f"\nGenerating {missing} puzzles for {diff}...")
+
+            # get_solver fails fast on an unknown backend. The batch
+            # backend digs up to _BATCH_PUZZLES puzzles per task.
+            batched = get_solver(solver, diff) is solve_and_count_batch
+            if batched:
+                worker = partial(_generate_batch_job, dedup=dedup)
+            else:
+                worker = partial(_generate_shared_job if shm is not None else _generate_job, solver=solver, dedup=dedup)
+            buffer = []
+            duplicates = 0
+            accepted = 0
+            if stats is not None:
+                stats.begin(diff, missing)
+            try:
+                while missing > 0:
+                    slots = missing if shm is None else min(missing, wave)
+                    if batched:
+                        # Enough tasks to keep every worker busy
+                        per_job = min(_BATCH_PUZZLES, -(-slots // cpu_count))
+                        jobs = [(diff, range(first, min(first + per_job, slots))) for first in range(0, slots, per_job)]
+                    elif shm is None:
+                        jobs = [diff] * missing
+                    else:
+                        jobs = [(diff, slot) for slot in range(slots)]
+                    chunksize = 1 if batched else max(1, min(16, len(jobs) // (cpu_count * 4)))
+                    results = pool.imap_unordered(worker, jobs, chunksize=chunksize)
+                    if batched:
+                        results = (result for batch in results for result in batch)
+                    for result, digest, info in results:
+                        if stats is not None:
+                            stats.record(diff, info)
+                        if index is not None and not index.add(digest):
+                            duplicates += 1
+                            continue
+                        # From shared memory, result is a slot; the wave's
+                        # records are written together once it is done,
+                        # before the next wave reuses the slots
+                        buffer.append(result)
+                        missing -= 1
+                        accepted += 1
+                        if stats is not None:
+                            stats.progress(accepted)
+                        if shm is not None or len(buffer) < chunk_size:
+                            continue
+                        _append_chunk(out, diff, _chunk(buffer, shm), index)
+                        buffer = []
+                        if time.monotonic() - last_sync >= fsync_interval:
+                            _sync(out, index)
+                            last_sync = time.monotonic()
+                    if shm is not None and buffer:
+                        _append_chunk(out, diff, _chunk(buffer, shm), index)
+                        buffer = []
+                        if time.monotonic() - last_sync >= fsync_interval:
+                            _sync(out, index)
+                            last_sync = time.monotonic()
+            finally:
+                # Keep whatever finished, even on Ctrl-C
+                if buffer:
+                    _append_chunk(out, diff, _chunk(buffer, shm), index)
+                _sync(out, index)
+            if stats is not None:
+                stats.progress(accepted, force=True)
+            if duplicates:
+                print(f"Skipped {duplicates} duplicate puzzles")
 
-            jobs = [diff] * per_diff
-            results = pool.map(generate_single_puzzle, jobs)
+    if index is not None:
+        index.close()
 
-            all_puzzles[diff].extend(results)
+    def sections(results, diff):
+        if not grade:
+            return {diff: results}
+        if isinstance(results, np.ndarray):
+            labels = np.array([grade_puzzle(m) for m in puzzle_store.unpack_metrics(results)])
+            return {label: results[labels == label] for label in np.unique(labels)}
+        graded = {}
+        for result in results:
+            label = grade_puzzle(result[2]) if len(result) > 2 else diff
+            graded.setdefault(label, []).append(result)
+        return graded
 
-    with open(filename, "wb") as f:
-        pickle.dump(all_puzzles, f)
+    counts = {d: 0 for d in difficulties}
+    for diff, results in _iter_checkpoint(checkpoint):
+        for label, graded in sections(results, diff).items():
+            counts[label] = counts.get(label, 0) + len(graded)
+    writer = puzzle_store.StoreWriter(filename, counts)
+    for diff, results in _iter_checkpoint(checkpoint):
+        for label, graded in sections(results, diff).items():
+            writer.write(label, graded)
+    # close() validates the new file before it replaces the old store; if
+    # anything is wrong it raises and the checkpoint is kept
+    writer.close()
+    os.remove(checkpoint)
 
     print(f"\nSaved puzzles to {filename}")
+    if stats is not None:
+        stats.summary()
 
 
 # -----------------------------
@@ -157,14 +1094,25 @@ def precompute_puzzles(per_diff=100, filename="sudoku_puzzles.pkl"):
 if __name__ == "__main__":
     mp.freeze_support()  # Windows safety
 
+    parser = argparse.ArgumentParser(description="Generate the puzzle store.")
+    parser.add_argument("per_diff", type=int, nargs="?", help="puzzles per level (asked for if omitted)")
+    parser.add_argument("--solver", default="bitmask", choices=sorted(SOLVERS))
+    parser.add_argument("--telemetry", action="store_true", help="show progress, stage timings and a summary")
+    parser.add_argument("--profile", metavar="DIR", help="write a cProfile dump per worker to DIR")
+    parser.add_argument("--shared-memory", action="store_true",
+                        help="pass results back through shared memory instead of pickling them")
+    args = parser.parse_args()
+
     def run():
         number_making = input("Number of games to make per level: ")
         try:
-            number_making = int(number_making)
+            return int(number_making)
         except ValueError:
             print("Please enter a valid integer.")
             return run()
 
-        precompute_puzzles(per_diff=number_making)
-
-    run()
+    precompute_puzzles(
+        per_diff=args.per_diff if args.per_diff is not None else run(),
+        solver=args.solver, instrument=args.telemetry, profile_dir=args.profile,
+        shared=args.shared_memory,
+    )
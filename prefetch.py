@@ -0,0 +1,117 @@
+import multiprocessing as mp
+import random
+import threading
+from collections import deque
+
+# -----------------------------
+# Background puzzle prefetching
+# -----------------------------
+# A worker process generates puzzles with precompute.generate_single_puzzle
+# and a thread in this process files them into per-difficulty queues.
+# Whenever a queue (counting puzzles already asked for) drops below the
+# watermark it is topped back up, so take() normally finds one ready and
+# never has to wait for generation.
+#
+# One prefetcher serves one board size (box=4 for 16x16, 5 for 25x25).
+# Difficulties it was not started with are queued the first time they
+# are taken.
+#
+# Every request carries a seed drawn from random when the prefetcher is
+# created, so the puzzles it deals follow from the caller's random seed
+# like store picks do, and a replayed session gets the same ones.
+
+
+def _worker(requests, results, solver, box):
+    import numpy as np
+    import precompute
+    import random
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        difficulty, seed = request
+        random.seed(seed)
+        np.random.seed(seed)
+        puzzle, solution, _ = precompute.generate_single_puzzle(difficulty, solver, box)
+        results.put((difficulty, np.asarray(puzzle).tolist(), np.asarray(solution).tolist()))
+    results.put(None)
+
+
+class PuzzlePrefetcher:
+    def __init__(self, difficulties, depth=3, watermark=2, solver="bitmask", on_ready=None, box=3):
+        # Each queue is topped up to depth puzzles. on_ready(difficulty) is
+        # called from the receiving thread each time a puzzle lands in one.
+        self.depth = depth
+        self.watermark = watermark
+        self.on_ready = on_ready
+        self.rng = random.Random(random.getrandbits(64))
+        self.ready = {diff: deque() for diff in difficulties}
+        self.pending = dict.fromkeys(difficulties, 0)
+        self.lock = threading.Lock()
+        self.arrived = threading.Condition(self.lock)
+
+        # spawn rather than fork: the parent has SDL and a window open
+        ctx = mp.get_context("spawn")
+        self.requests = ctx.Queue()
+        self.results = ctx.Queue()
+        self.process = ctx.Process(target=_worker, args=(self.requests, self.results, solver, box), daemon=True)
+        self.process.start()
+        self.thread = threading.Thread(target=self._receive, daemon=True)
+        self.thread.start()
+
+        with self.lock:
+            for diff in difficulties:
+                self._refill(diff)
+
+    def _refill(self, difficulty):
+        # Caller holds the lock
+        have = len(self.ready[difficulty]) + self.pending[difficulty]
+        if have < self.watermark:
+            for _ in range(self.depth - have):
+                self.requests.put((difficulty, self.rng.getrandbits(32)))
+            self.pending[difficulty] += self.depth - have
+
+    def _receive(self):
+        while True:
+            result = self.results.get()
+            if result is None:
+                break
+            difficulty, puzzle, solution = result
+            with self.lock:
+                self.pending[difficulty] -= 1
+                self.ready[difficulty].append((puzzle, solution))
+                self.arrived.notify_all()
+            if self.on_ready is not None:
+                self.on_ready(difficulty)
+
+    def take(self, difficulty):
+        # A ready (puzzle, solution), or None if the queue is still empty.
+        # Never blocks on generation.
+        with self.lock:
+            if difficulty not in self.ready:
+                self.ready[difficulty] = deque()
+                self.pending[difficulty] = 0
+            queue = self.ready[difficulty]
+            dealt = queue.popleft() if queue else None
+            self._refill(difficulty)
+        return dealt
+
+    def wait(self, difficulty, timeout=None):
+        # Blocks until a puzzle of difficulty is ready (for replays, which
+        # must not run ahead of generation); False on timeout
+        with self.lock:
+            return self.arrived.wait_for(lambda: self.ready.get(difficulty), timeout)
+
+    def available(self, difficulty):
+        with self.lock:
+            return len(self.ready.get(difficulty, ()))
+
+    def close(self, timeout=1.0):
+        # The worker finishes its current puzzle at most; after the
+        # timeout it is terminated
+        self.requests.put(None)
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.results.put(None)
+        self.thread.join(timeout)
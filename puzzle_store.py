@@ -0,0 +1,248 @@
+import mmap
+import os
+import pickle
+import struct
+
+import numpy as np
+
+# -----------------------------
+# Binary puzzle store
+# -----------------------------
+# Layout (little endian):
+#   header   magic "SDKU", version u16, record size u16, section count u16,
+#            reserved u16
+#   sections one per difficulty: name (16 bytes, NUL padded), offset u64,
+#            count u64
+#   records  fixed size, grouped by section: puzzle then solution, each
+#            81 cells packed two per byte (4 bits a cell, 41 bytes a grid),
+#            then the solver effort metrics as u32s (version 2 only)
+
+MAGIC = b"SDKU"
+VERSION = 2
+GRID_BYTES = 41
+METRIC_FIELDS = ("nodes", "backtracks", "guesses", "max_depth", "naked_singles", "hidden_singles")
+METRIC_DTYPE = np.dtype([(name, "<u4") for name in METRIC_FIELDS])
+RECORD_SIZES = {1: 2 * GRID_BYTES, 2: 2 * GRID_BYTES + METRIC_DTYPE.itemsize}
+RECORD_SIZE = RECORD_SIZES[VERSION]
+
+_HEADER = struct.Struct("<4sHHHH")
+_SECTION = struct.Struct("<16sQQ")
+
+
+def pack_grids(grids):
+    # (N, 9, 9) digits 0..9 -> (N, 41) uint8
+    flat = np.asarray(grids, dtype=np.uint8).reshape(-1, 81)
+    flat = np.concatenate([flat, np.zeros((len(flat), 1), dtype=np.uint8)], axis=1)
+    return (flat[:, 0::2] << 4) | flat[:, 1::2]
+
+
+def unpack_grids(packed):
+    # (N, 41) uint8 -> (N, 9, 9) int
+    packed = np.asarray(packed, dtype=np.uint8).reshape(-1, GRID_BYTES)
+    flat = np.empty((len(packed), 2 * GRID_BYTES), dtype=int)
+    flat[:, 0::2] = packed >> 4
+    flat[:, 1::2] = packed & 0x0F
+    return flat[:, :81].reshape(-1, 9, 9)
+
+
+def pack_records(results):
+    # [(puzzle, solution[, metrics]), ...] -> (N, RECORD_SIZE) uint8.
+    # Missing metrics are stored as zeros.
+    if not results:
+        return np.zeros((0, RECORD_SIZE), dtype=np.uint8)
+    metrics = np.zeros(len(results), dtype=METRIC_DTYPE)
+    for i, result in enumerate(results):
+        if len(result) > 2 and result[2]:
+            metrics[i] = tuple(result[2][name] for name in METRIC_FIELDS)
+    puzzles = [result[0] for result in results]
+    solutions = [result[1] for result in results]
+    return np.concatenate([
+        pack_grids(puzzles), pack_grids(solutions),
+        metrics.view(np.uint8).reshape(len(results), -1),
+    ], axis=1)
+
+
+def unpack_records(records):
+    # (N, record size) uint8 -> (puzzles, solutions), each (N, 9, 9)
+    records = np.asarray(records, dtype=np.uint8)
+    return unpack_grids(records[:, :GRID_BYTES]), unpack_grids(records[:, GRID_BYTES:2 * GRID_BYTES])
+
+
+def unpack_metrics(records):
+    # (N, RECORD_SIZE) uint8 -> (N,) METRIC_DTYPE array
+    records = np.ascontiguousarray(records[:, 2 * GRID_BYTES:RECORD_SIZE])
+    return records.view(METRIC_DTYPE).reshape(-1)
+
+
+# -----------------------------
+# Bulk validation
+# -----------------------------
+# Each digit becomes one bit, so a row, column or box is a permutation of
+# 1..9 exactly when its nine bits OR together to 0x1FF. Everything is
+# whole-array NumPy; there is no Python loop per grid.
+
+# digit -> bit; 0 and anything above 9 get no bit and so always fail
+_DIGIT_BITS = np.array([0] + [1 << d for d in range(9)] + [0], dtype=np.uint16)
+
+
+def validate_grids(puzzles, solutions):
+    # (N, 9, 9) puzzles and solutions -> (N,) bool, True where the solution
+    # is a valid completed grid and agrees with every given of the puzzle
+    puzzles = np.asarray(puzzles).reshape(-1, 9, 9)
+    solutions = np.asarray(solutions).reshape(-1, 9, 9)
+    bits = _DIGIT_BITS[np.clip(solutions, 0, 10)]
+
+    boxes = bits.reshape(-1, 3, 3, 3, 3).transpose(0, 1, 3, 2, 4).reshape(-1, 9, 9)
+    ok = (np.bitwise_or.reduce(bits, axis=2) == 0x1FF).all(axis=1)
+    ok &= (np.bitwise_or.reduce(bits, axis=1) == 0x1FF).all(axis=1)
+    ok &= (np.bitwise_or.reduce(boxes, axis=2) == 0x1FF).all(axis=1)
+    ok &= ((puzzles == 0) | (puzzles == solutions)).all(axis=(1, 2))
+    return ok
+
+
+class StoreWriter:
+    # Writes a store whose per-difficulty counts are known up front, so
+    # records can be streamed in any order without holding them in memory.
+    # The file only appears under its final name once close() succeeds,
+    # which includes every record passing validate_grids.
+
+    def __init__(self, filename, counts):
+        self.filename = filename
+        self.tmp = filename + ".tmp"
+        self.counts = dict(counts)
+        self.offsets = {}
+        self.written = {diff: 0 for diff in self.counts}
+
+        offset = _HEADER.size + _SECTION.size * len(self.counts)
+        header = [_HEADER.pack(MAGIC, VERSION, RECORD_SIZE, len(self.counts), 0)]
+        for diff, count in self.counts.items():
+            header.append(_SECTION.pack(diff.encode("ascii"), offset, count))
+            self.offsets[diff] = offset
+            offset += count * RECORD_SIZE
+
+        self.f = open(self.tmp, "wb")
+        self.f.write(b"".join(header))
+        self.f.truncate(offset)
+
+    def write(self, diff, results):
+        # results: list of (puzzle, solution[, metrics]) or an already
+        # packed (n, RECORD_SIZE) array
+        records = results if isinstance(results, np.ndarray) else pack_records(results)
+        if self.written[diff] + len(records) > self.counts[diff]:
+            raise ValueError(f"Too many records for '{diff}' (expected {self.counts[diff]})")
+        self.f.seek(self.offsets[diff] + self.written[diff] * RECORD_SIZE)
+        self.f.write(records.tobytes())
+        self.written[diff] += len(records)
+
+    def close(self):
+        short = {d: n for d, n in self.written.items() if n != self.counts[d]}
+        if short:
+            self.f.close()
+            os.remove(self.tmp)
+            raise ValueError(f"Store is missing records: {short}")
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+
+        # Integrity check of what actually landed on disk, before it
+        # replaces the old store; a bad file is removed and the old store
+        # stays as it was
+        with PuzzleStore(self.tmp) as store:
+            bad = store.validate()
+        if bad:
+            os.remove(self.tmp)
+            raise ValueError(f"Invalid puzzles in {self.filename}: " + ", ".join(f"{d} {len(i)}" for d, i in bad.items()))
+        os.replace(self.tmp, self.filename)
+
+
+def write_store(filename, all_puzzles):
+    # all_puzzles: dict difficulty -> list of (puzzle, solution[, metrics])
+    writer = StoreWriter(filename, {d: len(results) for d, results in all_puzzles.items()})
+    for diff, results in all_puzzles.items():
+        writer.write(diff, results)
+    writer.close()
+
+
+def convert_pickle(pkl_filename, filename):
+    # One-off migration from the old sudoku_puzzles.pkl format
+    with open(pkl_filename, "rb") as f:
+        write_store(filename, pickle.load(f))
+
+
+class PuzzleStore:
+    # Read-only, memory-mapped view of a store. Opening only parses the
+    # header; records are decoded one at a time on request.
+
+    def __init__(self, filename):
+        with open(filename, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.version, self.record_size, n_sections, _ = _HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or RECORD_SIZES.get(self.version) != self.record_size:
+            self.mm.close()
+            raise ValueError(f"'{filename}' is not a supported puzzle store")
+
+        self.sections = {}
+        for i in range(n_sections):
+            name, offset, count = _SECTION.unpack_from(self.mm, _HEADER.size + i * _SECTION.size)
+            if offset + count * self.record_size > len(self.mm):
+                self.mm.close()
+                raise ValueError(f"'{filename}' is truncated")
+            self.sections[name.rstrip(b"\0").decode("ascii")] = (offset, count)
+
+    @property
+    def difficulties(self):
+        return list(self.sections)
+
+    def count(self, difficulty):
+        return self.sections.get(difficulty, (0, 0))[1]
+
+    def records(self, difficulty, start=0, stop=None):
+        # Zero-copy (n, record size) view of a range of packed records
+        offset, count = self.sections[difficulty]
+        stop = count if stop is None else min(stop, count)
+        start = min(start, stop)
+        return np.frombuffer(
+            self.mm, dtype=np.uint8, count=(stop - start) * self.record_size,
+            offset=offset + start * self.record_size,
+        ).reshape(-1, self.record_size)
+
+    def get(self, difficulty, index):
+        puzzles, solutions = unpack_records(self.records(difficulty, index, index + 1))
+        if not len(puzzles):
+            raise IndexError(f"No puzzle {index} for difficulty '{difficulty}'")
+        return puzzles[0], solutions[0]
+
+    def metrics(self, difficulty, index):
+        # Solver effort recorded at generation time, or None for stores
+        # written before metrics existed
+        if self.version < 2:
+            return None
+        record = unpack_metrics(self.records(difficulty, index, index + 1))
+        if not len(record):
+            raise IndexError(f"No puzzle {index} for difficulty '{difficulty}'")
+        return {name: int(record[0][name]) for name in METRIC_FIELDS}
+
+    def validate(self, chunk=65536):
+        # Checks every record with validate_grids, a chunk at a time so
+        # memory stays bounded. Returns difficulty -> array of indices of
+        # bad records, for difficulties that have any.
+        bad = {}
+        for difficulty in self.sections:
+            failed = []
+            for start in range(0, self.count(difficulty), chunk):
+                ok = validate_grids(*unpack_records(self.records(difficulty, start, start + chunk)))
+                failed.append(np.flatnonzero(~ok) + start)
+            failed = np.concatenate(failed) if failed else np.zeros(0, dtype=int)
+            if len(failed):
+                bad[difficulty] = failed
+        return bad
+
+    def close(self):
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,94 @@
+import json
+import os
+import random
+
+# -----------------------------
+# Non-repeating puzzle sampling
+# -----------------------------
+# Deals indices in [0, n) for each difficulty in the order of a shuffled
+# permutation, so no puzzle repeats until all n have been dealt. The
+# permutation is never stored: position k maps to an index through a
+# small keyed Feistel network, so a draw is O(1) and the whole state per
+# difficulty is (n, seed, cursor) plus the last few indices dealt.
+#
+# Once a pass is used up a new seed starts the next one. Its first draws
+# could repeat what was just played, so indices from the recent window
+# are skipped (they come back in the pass after).
+#
+# The state is saved as JSON after every draw, so a restart carries on
+# where the last session left off. filename=None keeps it in memory only.
+
+_ROUNDS = 4
+_MASK64 = (1 << 64) - 1
+
+
+def _mix(value, key):
+    # Feistel round function: the splitmix64 finalizer, so every output
+    # bit depends on every input bit
+    value = (value * 0x9E3779B97F4A7C15 + key) & _MASK64
+    value = (value ^ value >> 30) * 0xBF58476D1CE4E5B9 & _MASK64
+    value = (value ^ value >> 27) * 0x94D049BB133111EB & _MASK64
+    return value ^ value >> 31
+
+
+def permute(position, n, seed):
+    # Index at position of a pseudo-random permutation of range(n) keyed by
+    # seed. The Feistel network permutes the smallest even power of two
+    # >= n; re-applying it until the result lands below n (cycle walking)
+    # keeps it a permutation of range(n), in under four passes on average.
+    half = max(1, ((n - 1).bit_length() + 1) // 2)
+    mask = (1 << half) - 1
+    index = position
+    while True:
+        left, right = index >> half, index & mask
+        for r in range(_ROUNDS):
+            left, right = right, left ^ (_mix(right, seed << 8 | r) & mask)
+        index = left << half | right
+        if index < n:
+            return index
+
+
+class PuzzleSampler:
+    def __init__(self, filename=None, window=20):
+        self.filename = filename
+        self.window = window
+        self.state = {}  # key -> {"n", "seed", "cursor", "recent"}
+        if filename is not None:
+            try:
+                with open(filename) as f:
+                    self.state = json.load(f)
+            except (OSError, ValueError):
+                pass  # missing or unreadable: start fresh
+
+    def draw(self, key, n):
+        # Next index in [0, n) for key (a difficulty). A different n than
+        # last time (the store was rebuilt) starts a new pass.
+        state = self.state.get(key)
+        if state is None or state["n"] != n:
+            state = self.state[key] = {"n": n, "seed": random.getrandbits(32), "cursor": 0, "recent": []}
+
+        # Never skip so much that a small pool can't deal anything
+        recent = state["recent"][-min(self.window, n // 2):] if n > 1 else []
+        while True:
+            if state["cursor"] >= n:
+                state["seed"] = random.getrandbits(32)
+                state["cursor"] = 0
+            index = permute(state["cursor"], n, state["seed"])
+            state["cursor"] += 1
+            if index not in recent:
+                break
+
+        state["recent"] = (state["recent"] + [index])[-self.window:]
+        self.save()
+        return index
+
+    def save(self):
+        if self.filename is None:
+            return
+        temp = self.filename + ".tmp"
+        try:
+            with open(temp, "w") as f:
+                json.dump(self.state, f)
+            os.replace(temp, self.filename)
+        except OSError:
+            pass  # dealing still works, only the next session starts over
@@ -0,0 +1,331 @@
+import argparse
+import json
+import os
+import random
+import struct
+import sys
+
+import numpy as np
+
+# -----------------------------
+# Session event log
+# -----------------------------
+# Layout (little endian):
+#   header  magic "SDKS", version u16, random seed u64
+#   events  frame u32, time ms u32, kind u8, x i16, y i16, key u32,
+#           extra u16
+# key is the pygame key code, which needs 32 bits (Shift and the arrow
+# keys are above 2**30). Version 1 logs kept it in x and are not read.
+# Events with the same frame number were handled together. The seed is
+# what random was seeded with before the first frame, so a replay against
+# the same puzzle store picks the same puzzles.
+
+MAGIC = b"SDKS"
+VERSION = 2
+
+_HEADER = struct.Struct("<4sHQ")
+_EVENT = struct.Struct("<IIBhhIH")
+
+# Event kinds as stored in the log. READY is a generated puzzle arriving
+# (x: difficulty index, y: box size), LOADED the loader thread finishing.
+QUIT, CLICK, MOTION, KEY, TICK, READY, LOADED = range(7)
+
+
+def _event_kinds():
+    import pygame
+    from app_class import TICK_EVENT, PUZZLE_READY, ASSETS_READY
+    return {
+        pygame.QUIT: QUIT,
+        pygame.MOUSEBUTTONDOWN: CLICK,
+        pygame.MOUSEMOTION: MOTION,
+        pygame.KEYDOWN: KEY,
+        TICK_EVENT: TICK,
+        PUZZLE_READY: READY,
+        ASSETS_READY: LOADED,
+    }
+
+
+def encode_event(event, kinds):
+    # pygame event -> (kind, x, y, key, extra), or None for event types
+    # that don't affect the game
+    kind = kinds.get(event.type)
+    if kind is None:
+        return None
+    if kind == CLICK:
+        return kind, event.pos[0], event.pos[1], 0, event.button
+    if kind == MOTION:
+        return kind, event.pos[0], event.pos[1], 0, 0
+    if kind == KEY:
+        return kind, 0, 0, event.key, ord(event.unicode) if event.unicode else 0
+    if kind == READY:
+        from app_class import DIFFICULTIES
+        return kind, [d.lower() for d in DIFFICULTIES].index(event.difficulty), event.box, 0, 0
+    return kind, 0, 0, 0, 0
+
+
+def decode_event(kind, x, y, key, extra):
+    import pygame
+    from app_class import TICK_EVENT, PUZZLE_READY, ASSETS_READY, DIFFICULTIES
+    if kind == CLICK:
+        return pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(x, y), button=extra)
+    if kind == MOTION:
+        return pygame.event.Event(pygame.MOUSEMOTION, pos=(x, y), rel=(0, 0), buttons=(0, 0, 0))
+    if kind == KEY:
+        return pygame.event.Event(pygame.KEYDOWN, key=key, unicode=chr(extra) if extra else "", mod=0)
+    if kind == TICK:
+        return pygame.event.Event(TICK_EVENT)
+    if kind == READY:
+        return pygame.event.Event(PUZZLE_READY, difficulty=DIFFICULTIES[x].lower(), box=y)
+    if kind == LOADED:
+        return pygame.event.Event(ASSETS_READY)
+    return pygame.event.Event(pygame.QUIT)
+
+
+class Recorder:
+    # Appends each batch of events as one frame. Set as App.recorder.
+
+    def __init__(self, filename, seed):
+        self.f = open(filename, "wb")
+        self.f.write(_HEADER.pack(MAGIC, VERSION, seed))
+        self.kinds = _event_kinds()
+        self.frame = 0
+        self.start = None
+
+    def write(self, events):
+        from app_class import ticks
+        now = ticks()
+        if self.start is None:
+            self.start = now
+        for event in events:
+            encoded = encode_event(event, self.kinds)
+            if encoded is not None:
+                self.f.write(_EVENT.pack(self.frame, now - self.start, *encoded))
+        self.frame += 1
+
+    def close(self):
+        self.f.close()
+
+
+def read_log(filename):
+    # Returns (seed, frames), frames being lists of pygame events
+    with open(filename, "rb") as f:
+        data = f.read()
+    magic, version, seed = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(f"'{filename}' is not a session log")
+    if version != VERSION:
+        raise ValueError(f"'{filename}' is a version {version} session log, expected version {VERSION}")
+
+    frames = []
+    last = None
+    whole = len(data) - (len(data) - _HEADER.size) % _EVENT.size  # ignore a torn last event
+    for frame, _, kind, x, y, key, extra in _EVENT.iter_unpack(data[_HEADER.size:whole]):
+        if frame != last:
+            frames.append([])
+            last = frame
+        frames[-1].append(decode_event(kind, x, y, key, extra))
+    return seed, frames
+
+
+# -----------------------------
+# Headless replay
+# -----------------------------
+
+def headless():
+    # Must run before the App (and so pygame.display) is created
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+
+def make_app():
+    from app_class import App
+
+    class HeadlessApp(App):
+        # The dummy video driver has no real mouse, so hover follows the
+        # last replayed mouse event instead
+        last_pos = (0, 0)
+        # Deal from a fresh sampler and never resume or autosave, so the
+        # seed alone picks the puzzles
+        sampler_file = None
+        snapshot_file = None
+
+        def pointer(self):
+            return self.last_pos
+
+    # Replays start fully loaded, so which frame a game starts on does not
+    # depend on how fast the loader thread was
+    app = HeadlessApp()
+    app.loaded.wait()
+    return app
+
+
+def replay(app, frames, recorder=None):
+    # Feeds each frame's events through App.frame. frames may be a
+    # generator that looks at the app between frames (see scripted_game).
+    # Returns an (n, 3) array of events/update/draw seconds per frame and
+    # a bool array marking frames that carried input.
+    timings = []
+    has_input = []
+    for events in frames:
+        if not app.running:
+            break
+        for event in events:
+            if hasattr(event, "pos"):
+                app.last_pos = event.pos
+            if hasattr(event, "difficulty"):
+                # A generated puzzle arrived here when recorded: wait for
+                # this run's generator to catch up
+                prefetcher = app.prefetchers.get(event.box)
+                if prefetcher is not None:
+                    prefetcher.wait(event.difficulty)
+        if recorder is not None:
+            recorder.write(events)
+        timings.append(app.frame(events))
+        has_input.append(any(hasattr(event, "pos") or hasattr(event, "key") for event in events))
+    return np.array(timings).reshape(-1, 3), np.array(has_input, dtype=bool)
+
+
+def scripted_game(app, difficulty="easy", hints=1, mistakes=3, box=3):
+    # Plays one game the way a person would: picks the board size and
+    # difficulty, takes some hints, types a few wrong numbers, pauses
+    # once, then fills in every remaining cell from the solution and goes
+    # back to the menu.
+    import pygame
+
+    def click(pos):
+        return [
+            pygame.event.Event(pygame.MOUSEMOTION, pos=pos, rel=(0, 0), buttons=(0, 0, 0)),
+            pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=pos, button=1),
+        ]
+
+    def key(value):
+        symbol = app.symbols[value - 1]
+        return [pygame.event.Event(pygame.KEYDOWN, key=ord(symbol.lower()), unicode=symbol, mod=0)]
+
+    def cell(x, y):
+        size = app.cellSize
+        return (app.gridPos[0] + x * size + size // 2, app.gridPos[1] + y * size + size // 2)
+
+    def button(buttons, text):
+        return next(b for b in buttons if b.text == text).rect.center
+
+    while app.menu_box != box:
+        yield click(app.menuButtons[-1].rect.center)
+    yield click(button(app.menuButtons, difficulty.capitalize()))
+    while app.waiting:
+        # Generated in the background: hand over the ready notice
+        yield [pygame.event.wait()]
+    for _ in range(hints):
+        yield click(button(app.playingButtons, "Hint"))
+
+    empty = [(x, y) for y in range(app.size) for x in range(app.size) if app.grid[y][x] == 0]
+    for x, y in empty[:mistakes]:
+        yield click(cell(x, y))
+        yield key(app.solution[y][x] % app.size + 1)
+
+    yield click(button(app.playingButtons, "Pause"))
+    yield click(button(app.playingButtons, "Resume"))
+
+    for x, y in empty:
+        yield click(cell(x, y))
+        yield key(app.solution[y][x])
+
+    yield click(button(app.playingButtons, "Menu"))
+
+
+def scripted_session(app, difficulties=("easy", "medium", "hard", "expert"), box=3):
+    for difficulty in difficulties:
+        yield from scripted_game(app, difficulty, box=box)
+
+
+def report(timings, has_input):
+    from benchmark import summarize
+    if not len(timings):
+        return {}
+    results = {
+        "events": summarize(timings[:, 0]),
+        "update": summarize(timings[:, 1]),
+        "draw": summarize(timings[:, 2]),
+        "frame": summarize(timings.sum(axis=1)),
+    }
+    if has_input.any():
+        results["input_latency"] = summarize(timings[has_input].sum(axis=1))
+    return results
+
+
+# -----------------------------
+# Entry point
+# -----------------------------
+
+def main(args):
+    # app_class changes into its own directory on import
+    for name in ("log", "save", "output"):
+        if getattr(args, name, None):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    if args.command == "record":
+        # Plays normally on the real display, logging every frame. Deals
+        # from a fresh sampler and starts at the menu without resuming, like
+        # the headless replay does, so the seed alone decides the puzzles.
+        from app_class import App
+
+        class RecordingApp(App):
+            sampler_file = None
+            snapshot_file = None
+
+        seed = random.randrange(2 ** 32)
+        random.seed(seed)
+        app = RecordingApp()
+        app.recorder = Recorder(args.log, seed)
+        try:
+            app.run()
+        finally:
+            app.recorder.close()
+
+    headless()
+    if args.command == "replay":
+        seed, frames = read_log(args.log)
+    else:
+        seed = args.seed
+    random.seed(seed)
+    app = make_app()
+
+    recorder = None
+    if args.command == "script":
+        frames = scripted_session(app, box=args.box)
+        if args.save:
+            recorder = Recorder(args.save, seed)
+
+    timings, has_input = replay(app, frames, recorder)
+    if recorder is not None:
+        recorder.close()
+
+    results = report(timings, has_input)
+    print(f"{len(timings)} frames, {int(has_input.sum())} with input")
+    for name, stats in results.items():
+        print(f"{name:<14} mean {stats['mean_ms']:8.3f} ms  p50 {stats['p50_ms']:8.3f} ms  p99 {stats['p99_ms']:8.3f} ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"seed": seed, "frames": len(timings), "results": results}, f, indent=2)
+        print(f"\nSaved results to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record, replay or script game sessions and time each frame.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record", help="play normally and log the session")
+    record.add_argument("log")
+
+    play = commands.add_parser("replay", help="replay a logged session headless")
+    play.add_argument("log")
+    play.add_argument("--output", help="write frame timings as JSON")
+
+    script = commands.add_parser("script", help="play a scripted game per difficulty headless")
+    script.add_argument("--seed", type=int, default=12345)
+    script.add_argument("--box", type=int, default=3, choices=[3, 4, 5], help="board box size: 3 (9x9), 4 (16x16), 5 (25x25)")
+    script.add_argument("--save", help="also log the session for later replays")
+    script.add_argument("--output", help="write frame timings as JSON")
+
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,166 @@
+import os
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+# -----------------------------
+# Game state snapshots
+# -----------------------------
+# Layout (little endian):
+#   header  magic "SDKG", version u16, box size u8, hints used u8,
+#           hints max u8, reserved u8, elapsed seconds u32, difficulty
+#           (16 bytes, NUL padded), crc32 u32
+#   body    cell values (one byte a cell, row-major), solution (same),
+#           locked cells (one bit a cell, np.packbits order)
+# 207 bytes for 9x9 (34 header + 81 + 81 + 11). The crc covers
+# everything but itself, so a write torn by a crash reads back as no
+# snapshot rather than a broken game.
+
+MAGIC = b"SDKG"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHBBBBI16sI")
+
+
+def pack(grid, solution, locked, difficulty, hints_used, hints_max, elapsed):
+    size = len(grid)
+    box = round(size ** 0.5)
+    mask = np.zeros((size, size), dtype=bool)
+    for x, y in locked:
+        mask[y, x] = True
+    body = (
+        np.asarray(grid, dtype=np.uint8).tobytes()
+        + np.asarray(solution, dtype=np.uint8).tobytes()
+        + np.packbits(mask).tobytes()
+    )
+    header = _HEADER.pack(MAGIC, VERSION, box, hints_used, hints_max, 0, elapsed, difficulty.encode(), 0)
+    crc = zlib.crc32(body, zlib.crc32(header[:-4]))
+    return header[:-4] + struct.pack("<I", crc) + body
+
+
+def unpack(data):
+    # dict of the packed fields, or None if data is not a whole, intact
+    # snapshot
+    if len(data) < _HEADER.size:
+        return None
+    magic, version, box, hints_used, hints_max, _, elapsed, difficulty, crc = _HEADER.unpack_from(data)
+    size = box * box
+    cells = size * size
+    if magic != MAGIC or version != VERSION or len(data) != _HEADER.size + 2 * cells + (cells + 7) // 8:
+        return None
+    if zlib.crc32(data[_HEADER.size:], zlib.crc32(data[:_HEADER.size - 4])) != crc:
+        return None
+
+    body = np.frombuffer(data, dtype=np.uint8, offset=_HEADER.size)
+    mask = np.unpackbits(body[2 * cells:], count=cells).reshape(size, size)
+    return {
+        "grid": body[:cells].reshape(size, size).tolist(),
+        "solution": body[cells:2 * cells].reshape(size, size).tolist(),
+        "locked": {(int(x), int(y)) for y, x in zip(*np.nonzero(mask))},
+        "difficulty": difficulty.rstrip(b"\0").decode(),
+        "hints_used": hints_used,
+        "hints_max": hints_max,
+        "elapsed": elapsed,
+    }
+
+
+def load(filename):
+    try:
+        with open(filename, "rb") as f:
+            return unpack(f.read())
+    except OSError:
+        return None
+
+
+# -----------------------------
+# Background autosave
+# -----------------------------
+
+class Autosaver:
+    # Writes the latest snapshot handed to update() on its own thread, at
+    # most once per interval seconds however often the game changes. The
+    # file stays open, and when its length is unchanged only the bytes
+    # that differ from the last write go to disk (a move is one cell byte
+    # plus the header), header last so its crc lands after the body.
+
+    def __init__(self, filename, interval=1.0):
+        self.filename = filename
+        self.interval = interval
+        self.latest = None
+        self.pending = False
+        self.written = None  # bytes as last written, None if no file
+        self.f = None
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closing = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+        self.thread.start()
+
+    def update(self, data):
+        # data from pack(), or None to delete the snapshot (game over)
+        with self.lock:
+            self.latest = data
+            self.pending = True
+        self.wake.set()
+
+    def _run(self):
+        last = 0.0
+        while True:
+            self.wake.wait()
+            delay = last + self.interval - time.monotonic()
+            if delay > 0:
+                self.closing.wait(delay)
+            with self.lock:
+                data, pending = self.latest, self.pending
+                self.pending = False
+                self.wake.clear()
+            if pending:
+                try:
+                    self._write(data)
+                except OSError:
+                    pass  # the next change tries again
+                last = time.monotonic()
+            if self.closing.is_set():
+                break
+        if self.f is not None:
+            self.f.close()
+
+    def _write(self, data):
+        if data is None:
+            if self.f is not None:
+                self.f.close()
+                self.f = None
+            if os.path.exists(self.filename):
+                os.remove(self.filename)
+            self.written = None
+            return
+
+        if self.f is None or self.written is None or len(data) != len(self.written):
+            if self.f is not None:
+                self.f.close()
+            self.f = open(self.filename, "wb+")
+            self.f.write(data)
+        else:
+            changed = np.flatnonzero(np.frombuffer(data, np.uint8) != np.frombuffer(self.written, np.uint8))
+            body = changed[changed >= _HEADER.size]
+            if len(body):
+                # One write per run of changed bytes
+                breaks = np.flatnonzero(np.diff(body) > 1) + 1
+                for run in np.split(body, breaks):
+                    start, stop = int(run[0]), int(run[-1]) + 1
+                    self.f.seek(start)
+                    self.f.write(data[start:stop])
+            if len(changed):
+                self.f.seek(0)
+                self.f.write(data[:_HEADER.size])
+        self.f.flush()
+        self.written = data
+
+    def close(self, timeout=1.0):
+        # Writes whatever is still pending, then stops the thread
+        self.closing.set()
+        self.wake.set()
+        self.thread.join(timeout)
@@ -0,0 +1,150 @@
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+from collections import deque
+from itertools import islice
+
+import precompute
+
+# -----------------------------
+# Batch solver
+# -----------------------------
+# Reads puzzles one per line in the usual 81-character format (digits,
+# with 0 or . for blanks) and writes one result line per puzzle:
+#
+#   line number <TAB> solution (81 digits, or - if none) <TAB> count
+#
+# count stops at --limit (so with the default 2: 0 none, 1 unique, 2 more
+# than one); malformed lines get count "invalid". Blank lines and lines
+# starting with # are skipped but still numbered.
+#
+# Lines are read and solved in chunks, with at most a few chunks per
+# worker in flight at a time, so memory stays flat however long the
+# input is.
+
+
+def parse_line(text):
+    # 81-character puzzle -> list of 81 ints, or None if malformed
+    text = text.strip()
+    if len(text) != 81:
+        return None
+    grid = []
+    for ch in text:
+        if ch in ".0":
+            grid.append(0)
+        elif "1" <= ch <= "9":
+            grid.append(ord(ch) - 48)
+        else:
+            return None
+    return grid
+
+
+def _solve_chunk(chunk, limit):
+    # [(line number, text), ...] -> [(line number, solution, count), ...]
+    results = []
+    for lineno, text in chunk:
+        grid = parse_line(text)
+        if grid is None:
+            results.append((lineno, "-", "invalid"))
+            continue
+        count, solution = precompute.solve(grid, limit)
+        results.append((lineno, "".join(map(str, solution)) if solution else "-", count))
+    return results
+
+
+def _chunks(lines, chunk_size):
+    numbered = (
+        (lineno, text) for lineno, text in enumerate(lines, 1)
+        if text.strip() and not text.lstrip().startswith("#")
+    )
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def solve_stream(lines, jobs=None, chunk_size=256, limit=2, ordered=True, window=None):
+    # Yields (line number, solution, count) for every puzzle line. With
+    # ordered=False results come back as chunks finish, which keeps all
+    # workers busy when some chunks are much slower than others.
+    chunks = _chunks(lines, chunk_size)
+    jobs = jobs or mp.cpu_count()
+    if jobs == 1:
+        for chunk in chunks:
+            yield from _solve_chunk(chunk, limit)
+        return
+
+    window = window or jobs * 4
+    with mp.Pool(processes=jobs) as pool:
+        if ordered:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(_solve_chunk, (chunk, limit)))
+                if len(pending) >= window:
+                    yield from pending.popleft().get()
+            while pending:
+                yield from pending.popleft().get()
+        else:
+            done = queue.Queue()
+            in_flight = 0
+
+            def collect():
+                result = done.get()
+                if isinstance(result, BaseException):
+                    raise result
+                return result
+
+            for chunk in chunks:
+                pool.apply_async(_solve_chunk, (chunk, limit), callback=done.put, error_callback=done.put)
+                in_flight += 1
+                if in_flight >= window:
+                    yield from collect()
+                    in_flight -= 1
+            for _ in range(in_flight):
+                yield from collect()
+
+
+# -----------------------------
+# Entry point
+# -----------------------------
+
+def main(args):
+    source = sys.stdin if args.input == "-" else open(args.input)
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    totals = {}
+    start = time.monotonic()
+    try:
+        results = solve_stream(source, args.jobs, args.chunk_size, args.limit, not args.unordered)
+        for lineno, solution, count in results:
+            out.write(f"{lineno}\t{solution}\t{count}\n")
+            totals[count] = totals.get(count, 0) + 1
+    except BrokenPipeError:
+        # Output closed early (e.g. piped into head): stop quietly
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.monotonic() - start
+    n = sum(totals.values())
+    counts = "  ".join(f"{count}: {totals[count]}" for count in sorted(totals, key=str))
+    sys.stderr.write(f"{n} puzzles in {elapsed:.2f}s ({n / elapsed if elapsed else 0:.1f}/s)  counts {counts}\n")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve puzzles from a file of 81-character lines.")
+    parser.add_argument("input", nargs="?", default="-", help="puzzle file (default: stdin)")
+    parser.add_argument("-o", "--output", default="-", help="result file (default: stdout)")
+    parser.add_argument("-j", "--jobs", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="puzzles per task (default 256)")
+    parser.add_argument("--limit", type=int, default=2, help="stop counting solutions here (default 2)")
+    parser.add_argument("--unordered", action="store_true", help="write results as they finish")
+    sys.exit(main(parser.parse_args()))
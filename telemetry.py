@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# -----------------------------
+# Stage timing (worker side)
+# -----------------------------
+
+class StageTimer:
+    # Accumulates wall time per named stage. Stages may nest; each one
+    # counts its own full duration.
+
+    def __init__(self):
+        self.times = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] = self.times.get(name, 0.0) + time.perf_counter() - start
+
+    def take(self):
+        # Returns the accumulated times and starts over
+        times, self.times = self.times, {}
+        return times
+
+
+# -----------------------------
+# Run telemetry (parent side)
+# -----------------------------
+
+HISTOGRAM_EDGES_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+class Telemetry:
+    # Collects per-puzzle timings from workers and prints a live progress
+    # line and an end-of-run summary.
+
+    def __init__(self, out=sys.stdout, interval=0.5):
+        self.out = out
+        self.interval = interval
+        self.start = time.monotonic()
+        self.last_print = 0.0
+        self.stages = {}     # difficulty -> stage -> seconds
+        self.durations = {}  # difficulty -> [seconds per puzzle]
+        self.workers = {}    # pid -> [puzzles, busy seconds]
+        self.phase_start = self.start
+        self.phase_done = 0
+
+    def begin(self, difficulty, total):
+        self.difficulty = difficulty
+        self.total = total
+        self.phase_done = 0
+        self.phase_start = time.monotonic()
+
+    def record(self, difficulty, info):
+        self.durations.setdefault(difficulty, []).append(info["elapsed"])
+        stages = self.stages.setdefault(difficulty, {})
+        for name, seconds in info["stages"].items():
+            stages[name] = stages.get(name, 0.0) + seconds
+        worker = self.workers.setdefault(info["pid"], [0, 0.0])
+        worker[0] += 1
+        worker[1] += info["elapsed"]
+
+    def progress(self, done, force=False):
+        self.phase_done = done
+        now = time.monotonic()
+        if not force and now - self.last_print < self.interval:
+            return
+        self.last_print = now
+        elapsed = now - self.phase_start
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - done) / rate if rate else float("inf")
+        eta_str = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta != float("inf") else "--:--:--"
+        self.out.write(f"\r  {self.difficulty}: {done}/{self.total}  {rate:7.1f} puzzles/s  ETA {eta_str}  ")
+        self.out.flush()
+        if force:
+            self.out.write("\n")
+
+    def summary(self):
+        lines = ["", "Stage totals (seconds; dig includes uniqueness):"]
+        for diff, stages in self.stages.items():
+            parts = "  ".join(f"{name} {seconds:8.2f}" for name, seconds in sorted(stages.items()))
+            lines.append(f"  {diff:<8} {parts}")
+
+        wall = time.monotonic() - self.start
+        lines.append("")
+        lines.append("Workers:")
+        for pid, (count, busy) in sorted(self.workers.items()):
+            lines.append(
+                f"  pid {pid:<7} {count:7} puzzles  {count / busy if busy else 0:8.1f}/s busy"
+                f"  {count / wall if wall else 0:8.1f}/s wall"
+            )
+
+        lines.append("")
+        lines.append("Generation time per puzzle:")
+        for diff, durations in self.durations.items():
+            lines.append(f"  {diff} (n={len(durations)})")
+            lines.extend(_histogram(durations))
+        self.out.write("\n".join(lines) + "\n")
+
+
+def _histogram(durations, width=40):
+    edges = HISTOGRAM_EDGES_MS
+    counts = [0] * (len(edges) + 1)
+    for seconds in durations:
+        ms = seconds * 1000
+        counts[sum(ms >= edge for edge in edges)] += 1
+    peak = max(counts) or 1
+    labels = [f"< {edges[0]} ms"] + [f"{lo}-{hi} ms" for lo, hi in zip(edges, edges[1:])] + [f">= {edges[-1]} ms"]
+    return [
+        f"    {label:>14} {count:7} {'#' * round(width * count / peak)}"
+        for label, count in zip(labels, counts) if count
+    ]
+
+
+def profile_path(directory):
+    return os.path.join(directory, f"worker-{os.getpid()}.prof")
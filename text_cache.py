@@ -0,0 +1,53 @@
+import pygame
+from collections import OrderedDict
+
+# -----------------------------
+# Shared font / text surface cache
+# -----------------------------
+# pygame.font.SysFont does a font lookup and load on every call, and
+# Font.render rasterizes from scratch. Fonts are kept per (face, size) and
+# rendered surfaces per (text, size, color, face, antialias), both with
+# least-recently-used eviction so the cache stays bounded.
+
+class TextCache:
+    def __init__(self, max_fonts=16, max_surfaces=512):
+        self.max_fonts = max_fonts
+        self.max_surfaces = max_surfaces
+        self.fonts = OrderedDict()
+        self.surfaces = OrderedDict()
+
+    def font(self, size, face="arial"):
+        key = (face, size)
+        font = self.fonts.get(key)
+        if font is None:
+            font = pygame.font.SysFont(face, size)
+            self.fonts[key] = font
+            if len(self.fonts) > self.max_fonts:
+                self.fonts.popitem(last=False)
+        else:
+            self.fonts.move_to_end(key)
+        return font
+
+    def render(self, text, size, color=(0, 0, 0), face="arial", antialias=True):
+        # The returned surface is shared; blit it, don't draw on it
+        key = (text, size, tuple(color), face, antialias)
+        surf = self.surfaces.get(key)
+        if surf is None:
+            surf = self.font(size, face).render(text, antialias, color)
+            self.surfaces[key] = surf
+            if len(self.surfaces) > self.max_surfaces:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surf
+
+    def clear(self):
+        self.fonts.clear()
+        self.surfaces.clear()
+
+
+text_cache = TextCache()
+
+
+def render_text(text, size, color=(0, 0, 0), face="arial", antialias=True):
+    return text_cache.render(text, size, color, face, antialias)